@@ -1,8 +1,93 @@
 from django.contrib import admin
-from .models import Profile, Wallet, Task, Payment, Transaction
+from django.http import FileResponse, Http404
+from django.template.response import TemplateResponse
+from django.urls import path
+from kenya_earn.auth_policy import PUBLIC, auth_policy
+from .models import Profile, Wallet, Task, Payment, Transaction, IdempotencyKey, WalletShard, BalanceCheckpoint, DailyRollup, AccountPurge, OutboxEvent, StreamOffset, DeviceToken, Notification, RiskFlag
+from .services import feed, notifications, profiling
+from .services import outbox
 
 admin.site.register(Profile)
 admin.site.register(Wallet)
-admin.site.register(Task)
+admin.site.register(WalletShard)
 admin.site.register(Payment)
-admin.site.register(Transaction)
\ No newline at end of file
+admin.site.register(Transaction)
+admin.site.register(BalanceCheckpoint)
+admin.site.register(IdempotencyKey)
+admin.site.register(DailyRollup)
+admin.site.register(AccountPurge)
+admin.site.register(OutboxEvent)
+admin.site.register(StreamOffset)
+admin.site.register(DeviceToken)
+admin.site.register(Notification)
+admin.site.register(RiskFlag)
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    def save_model(self, request, obj, form, change):
+        # Tasks are approved/rejected here; the admin wraps this in a transaction
+        super().save_model(request, obj, form, change)
+        if not change and obj.status == 'available':
+            data = {'task_id': obj.id}
+            if obj.target_cities or obj.target_cohort:
+                # Only the users whose feed shows it
+                notifications.notify_each(feed.audience(obj), 'task.published', "New task available", obj.title, data)
+            else:
+                notifications.notify(None, 'task.published', "New task available", obj.title, data)
+        if change and 'status' in form.changed_data and obj.status in ('approved', 'rejected'):
+            outbox.emit('task', f'task.{obj.status}', obj.id, {
+                'id': obj.id,
+                'assigned_to_id': obj.assigned_to_id,
+                'reward_amount': obj.reward_amount,
+                'status': obj.status,
+            })
+
+
+
+# -------------------------
+# REQUEST PROFILES
+# -------------------------
+# Reports live on disk (core.services.profiling), not in the database,
+# so they get plain admin views instead of a ModelAdmin.
+
+admin.site.index_template = 'admin/kenya_earn_index.html'
+
+
+def profiling_report_list(request):
+    return TemplateResponse(request, 'admin/profiling/report_list.html', {
+        **admin.site.each_context(request),
+        'title': 'Request profiles',
+        'reports': profiling.list_reports(),
+    })
+
+
+def profiling_report_detail(request, report_id):
+    report = profiling.get_report(report_id)
+    if report is None:
+        raise Http404
+    return TemplateResponse(request, 'admin/profiling/report_detail.html', {
+        **admin.site.each_context(request),
+        'title': f"{report['method']} {report['path']}",
+        'report': report,
+    })
+
+
+def profiling_artifact(request, report_id, ext):
+    path = profiling.artifact_path(report_id, ext)
+    if path is None:
+        raise Http404
+    return FileResponse(
+        open(path, 'rb'),
+        content_type=profiling.ARTIFACT_TYPES[ext],
+        as_attachment=ext in ('prof', 'speedscope.json'),
+        filename=path.name,
+    )
+
+
+# Staff session auth via admin_view, so no Firebase token
+profiling_urls = [
+    path('', auth_policy(PUBLIC)(admin.site.admin_view(profiling_report_list)), name='profiling_report_list'),
+    path('<str:report_id>/', auth_policy(PUBLIC)(admin.site.admin_view(profiling_report_detail)), name='profiling_report_detail'),
+    path('<str:report_id>/<str:ext>', auth_policy(PUBLIC)(admin.site.admin_view(profiling_artifact)), name='profiling_artifact'),
+]
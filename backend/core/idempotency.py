@@ -0,0 +1,122 @@
+# kenya-earn/backend/core/idempotency.py
+import functools
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+
+
+def _claim(firebase_uid, key, request_hash):
+    """
+    Insert the key as an in-flight marker, committed on its own so duplicates
+    can see it. The unique constraint decides which request creates the row;
+    every other one gets the existing row. Returns (record, created).
+    """
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(
+                firebase_uid=firebase_uid, key=key, request_hash=request_hash
+            ), True
+    except IntegrityError:
+        pass
+
+    record = IdempotencyKey.objects.filter(firebase_uid=firebase_uid, key=key).first()
+    if record is None:
+        return _claim(firebase_uid, key, request_hash)
+
+    if record.status_code is not None and record.created_at < now - _ttl():
+        # Replay window is over: the key is free for a new request
+        taken = IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at).update(
+            request_hash=request_hash, status_code=None, response_body=None, created_at=now
+        )
+        if taken:
+            record.request_hash, record.status_code, record.response_body = request_hash, None, None
+            record.created_at = now
+            return record, True
+        record.refresh_from_db()
+    return record, False
+
+
+def _lock(record):
+    """
+    Lock the key row for the rest of the surrounding transaction, without
+    waiting. Whoever holds the lock is running the view; the lock goes away
+    with its transaction, so a crashed worker can't keep the key forever.
+    Raises DatabaseError if another request holds it.
+    """
+    with transaction.atomic():
+        return IdempotencyKey.objects.select_for_update(nowait=True).filter(pk=record.pk).first()
+
+
+def _in_progress():
+    response = Response({'error': 'A request with this Idempotency-Key is in progress'}, status=409)
+    response['Retry-After'] = '1'
+    return response
+
+
+def _replay(record):
+    response = Response(record.response_body, status=record.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    """
+    Make a money-moving POST safe to retry. Requests carrying an
+    Idempotency-Key header run once per user and key; retries get the
+    stored response back without running the view again.
+
+    The view runs in one transaction with the stored response, holding a
+    row lock on the key. A duplicate that finds the lock taken gets a 409.
+    A key left in flight with no lock held belonged to a request whose
+    transaction died, so none of its writes committed and it runs again.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return view(request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({'error': 'Idempotency-Key too long'}, status=400)
+
+        request_hash = hashlib.sha256(request.path.encode() + b'\n' + request.body).hexdigest()
+        record, created = _claim(request.firebase_uid, key, request_hash)
+
+        if not created:
+            if record.request_hash != request_hash:
+                return Response({'error': 'Idempotency-Key reused with a different request'}, status=422)
+            if record.status_code is not None:
+                return _replay(record)
+
+        with transaction.atomic():
+            try:
+                locked = _lock(record)
+            except DatabaseError:
+                return _in_progress()
+            if locked is None:
+                # Released by a request that failed retryably just now
+                return _in_progress()
+            if locked.status_code is not None:
+                return _replay(locked)
+
+            response = view(request, *args, **kwargs)
+            if response.status_code >= 500 or response.status_code == 429:
+                # Let the client retry server-side failures and rate limits for real
+                locked.delete()
+            else:
+                locked.status_code = response.status_code
+                locked.response_body = response.data
+                locked.save(update_fields=['status_code', 'response_body'])
+        return response
+
+    return wrapper
@@ -0,0 +1,59 @@
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.models import Profile, Wallet, WalletShard
+from core.services import wallets
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure concurrent credits to one hot wallet, plain vs sharded. "
+        "Creates and deletes its own throwaway profile; run against PostgreSQL for meaningful numbers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=32)
+        parser.add_argument('--credits', type=int, default=200, help="Credits per thread")
+        parser.add_argument('--hold-ms', type=float, default=5, help="Work held inside each credit's transaction")
+
+    def handle(self, *args, **options):
+        profile = Profile.objects.create(firebase_uid='benchmark-wallet-credits', first_name='Benchmark')
+        wallet = Wallet.objects.create(profile=profile)
+        try:
+            for sharded in (False, True):
+                if sharded:
+                    wallets.enable_sharding(wallet)
+                elapsed = self._run(wallet, **options)
+                wallet.refresh_from_db()
+                total = options['threads'] * options['credits']
+                self.stdout.write(
+                    f"{'sharded' if sharded else 'plain':8} {total} credits in {elapsed:.2f}s "
+                    f"({total / elapsed:.0f}/s), balance {wallets.get_balance(wallet)}"
+                )
+                WalletShard.objects.filter(wallet=wallet).update(balance=0)
+                Wallet.objects.filter(pk=wallet.pk).update(balance=0)
+        finally:
+            profile.delete()
+
+    def _run(self, wallet, threads, credits, hold_ms, **options):
+        def worker():
+            try:
+                for _ in range(credits):
+                    # The row lock is held until commit, like a credit inside a view's transaction
+                    with transaction.atomic():
+                        wallets.credit(wallet, Decimal('1.00'))
+                        time.sleep(hold_ms / 1000)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        started = time.monotonic()
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        return time.monotonic() - started
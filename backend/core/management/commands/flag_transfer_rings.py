@@ -0,0 +1,92 @@
+import random
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import Profile, RiskFlag, Transaction
+
+
+def find_cycles(edges, max_length):
+    """Return each simple cycle of at most max_length users once, as a tuple starting at its smallest id."""
+    cycles = set()
+
+    def walk(start, node, path):
+        for nxt in edges.get(node, ()):
+            if nxt == start and len(path) > 1:
+                cycles.add(tuple(path))
+            elif nxt > start and nxt not in path and len(path) < max_length:
+                walk(start, nxt, path + [nxt])
+
+    for start in edges:
+        walk(start, start, [start])
+    return cycles
+
+
+class Command(BaseCommand):
+    help = "Sample recent transfers and flag referral funnels and transfer cycles for review."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help="How far back to look")
+        parser.add_argument('--sample', type=float, default=1.0, help="Fraction of senders to include")
+        parser.add_argument('--funnel-size', type=int, default=3, help="Referred senders paying one referrer")
+        parser.add_argument('--max-cycle', type=int, default=4, help="Longest transfer cycle to look for")
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(hours=options['hours'])
+        transfers = (
+            Transaction.objects.filter(
+                type='transfer', direction='debit', status='completed',
+                timestamp__gte=since, recipient__isnull=False,
+            )
+            .values_list('wallet__profile_id', 'recipient_id', 'amount')
+            .iterator()
+        )
+
+        # Sample by sender so a sampled sender's whole outflow is kept
+        keep = {}
+        edges = defaultdict(set)
+        totals = defaultdict(lambda: 0)
+        for sender_id, recipient_id, amount in transfers:
+            if sender_id not in keep:
+                keep[sender_id] = random.random() < options['sample']
+            if keep[sender_id]:
+                edges[sender_id].add(recipient_id)
+                totals[sender_id, recipient_id] += amount
+
+        senders = [s for s, kept in keep.items() if kept]
+        referred_by = dict(Profile.objects.filter(id__in=senders).values_list('id', 'referred_by_id'))
+        funnels = defaultdict(list)
+        for sender_id, recipients in edges.items():
+            referrer = referred_by.get(sender_id)
+            if referrer in recipients:
+                funnels[referrer].append(sender_id)
+
+        found = []
+        for referrer, referred in funnels.items():
+            if len(referred) >= options['funnel_size']:
+                found.append((referrer, 'referral_funnel', {
+                    'senders': referred,
+                    'total': str(sum(totals[s, referrer] for s in referred)),
+                }))
+        for cycle in find_cycles(edges, options['max_cycle']):
+            details = {'cycle': list(cycle)}
+            found.extend((member, 'cycle', details) for member in cycle)
+
+        # Skip anyone who already has an unreviewed flag for the same reason
+        open_flags = set(
+            RiskFlag.objects.filter(reviewed=False, profile_id__in={f[0] for f in found})
+            .values_list('profile_id', 'reason')
+        )
+        new = []
+        for profile_id, reason, details in found:
+            if (profile_id, reason) not in open_flags:
+                open_flags.add((profile_id, reason))
+                new.append(RiskFlag(profile_id=profile_id, reason=reason, details=details))
+        RiskFlag.objects.bulk_create(new)
+
+        self.stdout.write(
+            f"Sampled {len(senders)} of {len(keep)} senders: "
+            f"{len(new)} new flags ({len(found) - len(new)} already open)"
+        )
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.services import profiling
+
+
+class Command(BaseCommand):
+    help = "Issue a signed X-Profile-Token that makes ProfilingMiddleware profile your requests."
+
+    def add_arguments(self, parser):
+        parser.add_argument('issued_to', help="Who the token is for; shown on each report")
+        parser.add_argument('--minutes', type=int, default=60, help="How long the token stays valid")
+
+    def handle(self, *args, **options):
+        self.stdout.write(profiling.make_token(options['issued_to'], options['minutes']))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.models import AccountPurge
+from core.services.accounts import purge
+
+
+class Command(BaseCommand):
+    help = "Remove the rows of deleted accounts in small batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows per delete/update statement")
+        parser.add_argument('--max-seconds', type=float, help="Stop after this long; the next run resumes")
+
+    def handle(self, *args, **options):
+        deadline = time.monotonic() + options['max_seconds'] if options['max_seconds'] else None
+        done = 0
+        for record in AccountPurge.objects.filter(completed_at__isnull=True).order_by('requested_at'):
+            started = time.monotonic()
+            if not purge(record, options['batch_size'], deadline):
+                self.stdout.write(f"Out of time during profile {record.profile_id}; will resume")
+                break
+            record.refresh_from_db()
+            done += 1
+            self.stdout.write(
+                f"Purged profile {record.profile_id}: {record.rows_purged} rows in {time.monotonic() - started:.1f}s"
+            )
+        self.stdout.write(f"Finished {done} account purges")
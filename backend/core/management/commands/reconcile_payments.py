@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import Payment
+from core.services import mpesa, outbox, paystack
+
+# Daraja CheckoutRequestIDs look like ws_CO_...; everything else is a Paystack reference
+MPESA_PREFIX = 'ws_CO_'
+MPESA_FAILED_CODES = {'1', '1032', '1037', '2001'}  # insufficient funds, cancelled, timeout, wrong PIN
+
+_local = threading.local()
+
+
+def _session():
+    # requests.Session isn't thread-safe, so keep one per worker for keep-alive
+    if not hasattr(_local, 'session'):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def check_payment(payment, mpesa_token=None):
+    """
+    Ask the provider what happened to a pending payment.
+    Returns ('success', amount_kes), ('failed', None) or ('pending', None).
+    """
+    reference = payment.mpesa_checkout_id
+    if reference.startswith(MPESA_PREFIX):
+        result = mpesa.stk_push_query(reference, access_token=mpesa_token)
+        code = str(result.get('ResultCode', ''))
+        if code == '0':
+            return 'success', payment.amount
+        if code in MPESA_FAILED_CODES:
+            return 'failed', None
+        return 'pending', None
+
+    result = paystack.verify_transaction(reference, session=_session())
+    data = result.get('data') or {}
+    if result.get('status') and data.get('status') == 'success':
+        return 'success', data['amount'] / 100  # cents → KES
+    if result.get('status') and data.get('status') in ('failed', 'abandoned', 'reversed'):
+        return 'failed', None
+    return 'pending', None
+
+
+class Command(BaseCommand):
+    help = "Resolve stale pending payments by asking Paystack / M-Pesa for their status."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=30, help="Minutes a payment must have been pending")
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=16, help="Provider requests in flight at once")
+        parser.add_argument('--dry-run', action='store_true', help="Report outcomes without applying them")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(minutes=options['older_than'])
+        stale = Payment.objects.filter(status='pending', created_at__lt=cutoff).order_by('created_at', 'id')
+        executor = ThreadPoolExecutor(max_workers=options['concurrency'])
+        counts = {'success': 0, 'failed': 0, 'pending': 0, 'error': 0}
+        started = time.monotonic()
+        mpesa_token = self._mpesa_token(stale)
+
+        last = None
+        try:
+            while True:
+                page = stale
+                if last is not None:
+                    page = page.filter(Q(created_at__gt=last.created_at) | Q(created_at=last.created_at, id__gt=last.id))
+                chunk = list(page.only('id', 'mpesa_checkout_id', 'amount', 'created_at')[:options['chunk_size']])
+                if not chunk:
+                    break
+                last = chunk[-1]
+
+                results = asyncio.run(self._check_chunk(chunk, executor, options['concurrency'], mpesa_token))
+                self._apply(results, counts, options['dry_run'])
+        finally:
+            executor.shutdown()
+
+        elapsed = time.monotonic() - started
+        checked = sum(counts.values())
+        self.stdout.write(
+            f"Checked {checked} payments in {elapsed:.1f}s: "
+            f"{counts['success']} activated, {counts['failed']} failed, "
+            f"{counts['pending']} still pending, {counts['error']} errors"
+        )
+
+    def _mpesa_token(self, stale):
+        # One OAuth token for the whole run (they last an hour), not one per query
+        if not stale.filter(mpesa_checkout_id__startswith=MPESA_PREFIX).exists():
+            return None
+        try:
+            return mpesa.get_mpesa_access_token()
+        except requests.RequestException as e:
+            self.stderr.write(f"Could not get an M-Pesa access token: {e}")
+            return None
+
+    async def _check_chunk(self, chunk, executor, concurrency, mpesa_token):
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def check(payment):
+            async with semaphore:
+                try:
+                    return payment, *(await loop.run_in_executor(executor, check_payment, payment, mpesa_token))
+                except Exception as e:
+                    self.stderr.write(f"Could not check {payment.mpesa_checkout_id}: {e}")
+                    return payment, 'error', None
+
+        return await asyncio.gather(*(check(payment) for payment in chunk))
+
+    def _apply(self, results, counts, dry_run):
+        failed_ids = []
+        for payment, outcome, amount in results:
+            counts[outcome] += 1
+            if dry_run:
+                continue
+            if outcome == 'success':
+                # Same idempotent path as the webhook
+                paystack.complete_activation(payment.mpesa_checkout_id, amount)
+            elif outcome == 'failed':
+                failed_ids.append(payment.id)
+
+        if failed_ids:
+            with transaction.atomic():
+                failed = list(Payment.objects.select_for_update().filter(id__in=failed_ids, status='pending'))
+                Payment.objects.filter(id__in=[p.id for p in failed]).update(status='failed')
+                for payment in failed:
+                    payment.status = 'failed'
+                    outbox.emit('payment', 'payment.failed', payment.id, paystack.payment_payload(payment))
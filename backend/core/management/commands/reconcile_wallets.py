@@ -0,0 +1,135 @@
+import csv
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import F, Max, Min, Sum
+
+from core.models import Transaction, Wallet, WalletShard
+from core.services.wallets import LEDGER_AMOUNT, LEDGER_FILTER
+
+
+def _init_worker():
+    django.setup()
+    # Never share the parent's database connections across processes
+    connections.close_all()
+
+
+def check_range(lo, hi):
+    """
+    Compare stored balances with ledger sums for wallets with lo <= id < hi.
+    One query for balances, one grouped aggregate for the ledger (and one for
+    shards if any wallet in range is sharded). Returns [(id, stored, ledger)].
+    """
+    stored = {}
+    sharded = []
+    for wallet_id, balance, is_sharded in (
+        Wallet.objects.filter(id__gte=lo, id__lt=hi).values_list('id', 'balance', 'is_sharded')
+    ):
+        stored[wallet_id] = balance
+        if is_sharded:
+            sharded.append(wallet_id)
+    if not stored:
+        return []
+
+    if sharded:
+        for row in (
+            WalletShard.objects.filter(wallet_id__in=sharded)
+            .values('wallet_id').annotate(total=Sum('balance'))
+        ):
+            stored[row['wallet_id']] += row['total'] or 0
+
+    ledger = dict(
+        Transaction.objects.filter(LEDGER_FILTER, wallet_id__gte=lo, wallet_id__lt=hi)
+        .values('wallet_id').annotate(total=Sum(LEDGER_AMOUNT))
+        .values_list('wallet_id', 'total')
+    )
+
+    zero = Decimal('0.00')
+    return [
+        (wallet_id, balance, ledger.get(wallet_id) or zero)
+        for wallet_id, balance in stored.items()
+        if balance != (ledger.get(wallet_id) or zero)
+    ]
+
+
+class Command(BaseCommand):
+    help = "Compare every wallet's stored balance with its transaction ledger."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help="Wallet ids per chunk")
+        parser.add_argument('--workers', type=int, default=1, help="Processes checking chunks in parallel")
+        parser.add_argument('--report', help="Write discrepancies as CSV to this path instead of stdout")
+        parser.add_argument('--fix', action='store_true', help="Move each drifted balance onto its ledger sum")
+
+    def handle(self, *args, **options):
+        bounds = Wallet.objects.aggregate(lo=Min('id'), hi=Max('id'))
+        if bounds['lo'] is None:
+            self.stdout.write("No wallets")
+            return
+
+        chunk = options['chunk_size']
+        ranges = [(lo, lo + chunk) for lo in range(bounds['lo'], bounds['hi'] + 1, chunk)]
+        started = time.monotonic()
+
+        out = open(options['report'], 'w', newline='') if options['report'] else sys.stdout
+        writer = csv.writer(out)
+        writer.writerow(['wallet_id', 'stored', 'ledger', 'difference'])
+        found = fixed = 0
+        drift = Decimal('0.00')
+        try:
+            for discrepancies in self._check(ranges, options['workers']):
+                for wallet_id, stored, ledger in discrepancies:
+                    writer.writerow([wallet_id, stored, ledger, ledger - stored])
+                    drift += ledger - stored
+                found += len(discrepancies)
+                if options['fix'] and discrepancies:
+                    fixed += self._fix(discrepancies)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+        elapsed = time.monotonic() - started
+        summary = f"Checked {bounds['hi'] - bounds['lo'] + 1} wallet ids in {elapsed:.1f}s: {found} drifted, net {drift}"
+        if options['fix']:
+            summary += f", {fixed} corrected"
+        self.stderr.write(summary)
+
+    def _check(self, ranges, workers):
+        if workers <= 1:
+            for lo, hi in ranges:
+                yield check_range(lo, hi)
+            return
+
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            los, his = zip(*ranges)
+            yield from pool.map(check_range, los, his)
+
+    def _fix(self, discrepancies):
+        # The scan reads balances and ledger in separate statements, so a
+        # transfer committing in between looks like drift. Re-check each
+        # wallet with its row (and shards) locked, which waits out any
+        # in-flight credit, and only correct what is still wrong.
+        fixed = 0
+        for wallet_id in sorted(d[0] for d in discrepancies):
+            with transaction.atomic():
+                wallet = Wallet.objects.select_for_update().filter(pk=wallet_id).first()
+                if wallet is None:
+                    continue
+                stored = wallet.balance
+                if wallet.is_sharded:
+                    shards = WalletShard.objects.select_for_update().filter(wallet=wallet).order_by('index')
+                    stored += sum((shard.balance for shard in shards), Decimal('0.00'))
+                ledger = (
+                    Transaction.objects.filter(LEDGER_FILTER, wallet_id=wallet_id)
+                    .aggregate(total=Sum(LEDGER_AMOUNT))['total'] or Decimal('0.00')
+                )
+                if ledger != stored:
+                    Wallet.objects.filter(pk=wallet_id).update(balance=F('balance') + (ledger - stored))
+                    fixed += 1
+        return fixed
@@ -0,0 +1,51 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import OutboxEvent
+from core.services import outbox
+
+PRUNE_BATCH = 10000
+
+
+class Command(BaseCommand):
+    help = "Publish outbox events to the configured change-stream sink (run one instance)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--follow', action='store_true', help="Keep polling instead of exiting when drained")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds between polls with --follow")
+        parser.add_argument('--prune-days', type=int, default=7, help="Delete events published longer ago than this")
+        parser.add_argument('--prune-interval', type=float, default=3600, help="Seconds between prunes with --follow")
+
+    def handle(self, *args, **options):
+        sink = outbox.get_sink()
+        published = pruned = 0
+        last_prune = None
+        while True:
+            if last_prune is None or time.monotonic() - last_prune >= options['prune_interval']:
+                pruned += self._prune(options['prune_days'])
+                last_prune = time.monotonic()
+
+            sent = outbox.relay(sink, options['batch_size'])
+            published += sent
+            if sent:
+                continue
+            if not options['follow']:
+                break
+            time.sleep(options['poll_interval'])
+
+        self.stdout.write(f"Published {published} events, pruned {pruned}")
+
+    def _prune(self, days):
+        cutoff = timezone.now() - timedelta(days=days)
+        old = OutboxEvent.objects.filter(published_at__lt=cutoff)
+        pruned = 0
+        # Bounded deletes, so a large backlog doesn't hold one long lock
+        while True:
+            ids = list(old.order_by('id').values_list('id', flat=True)[:PRUNE_BATCH])
+            if not ids:
+                return pruned
+            pruned += OutboxEvent.objects.filter(id__in=ids).delete()[0]
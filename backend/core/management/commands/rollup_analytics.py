@@ -0,0 +1,17 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from core.services.analytics import refresh_rollups
+
+
+class Command(BaseCommand):
+    help = "Update the daily analytics rollups from the last rolled-up day through today."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lookback-days', type=int, default=2, help="Days before the high-water mark to recompute")
+        parser.add_argument('--since', type=date.fromisoformat, help="Rebuild from this day (YYYY-MM-DD) instead")
+
+    def handle(self, *args, **options):
+        since, rows = refresh_rollups(options['lookback_days'], options['since'])
+        self.stdout.write(f"Rolled up {rows} day/city rows since {since}")
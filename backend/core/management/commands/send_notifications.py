@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.services import notifications
+
+
+class Command(BaseCommand):
+    help = "Send queued push notifications in batches through the configured sender."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Notifications claimed per round")
+        parser.add_argument('--concurrency', type=int, default=4, help="Sender batches in flight at once")
+        parser.add_argument('--max-attempts', type=int, default=5)
+        parser.add_argument('--follow', action='store_true', help="Keep polling instead of exiting when drained")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds between polls with --follow")
+
+    def handle(self, *args, **options):
+        sender = notifications.get_sender()
+        handled = pushed = 0
+        started = time.monotonic()
+        while True:
+            count, sent = notifications.send_due(
+                sender, options['batch_size'], options['concurrency'], options['max_attempts']
+            )
+            handled += count
+            pushed += sent
+            if count:
+                continue
+            if not options['follow']:
+                break
+            time.sleep(options['poll_interval'])
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"Handled {handled} notifications, {pushed} pushes delivered in {elapsed:.1f}s")
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Wallet
+from core.services import wallets
+
+
+class Command(BaseCommand):
+    help = "Switch hot wallets (by owner's referral code) to sharded sub-balances."
+
+    def add_arguments(self, parser):
+        parser.add_argument('referral_codes', nargs='+')
+        parser.add_argument('--shards', type=int, default=settings.WALLET_SHARD_COUNT)
+
+    def handle(self, *args, **options):
+        for code in options['referral_codes']:
+            try:
+                wallet = Wallet.objects.get(profile__referral_code=code)
+            except Wallet.DoesNotExist:
+                raise CommandError(f"No wallet for referral code {code}")
+            wallets.enable_sharding(wallet, options['shards'])
+            self.stdout.write(f"Sharded wallet of {code} into {options['shards']} sub-balances")
@@ -0,0 +1,36 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services import outbox
+
+
+class Command(BaseCommand):
+    help = "Print change-stream events for a consumer from its stored offset, committing as it goes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('consumer')
+        parser.add_argument('--from-offset', type=int, help="Start here instead of the stored offset")
+        parser.add_argument('--topic', action='append', help="Only print these topics (repeatable)")
+        parser.add_argument('--follow', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            reader = outbox.get_reader()
+        except NotImplementedError as e:
+            raise CommandError(f"{e}; tail_changes needs a sink another process can read, such as SegmentedFileSink")
+        offset = options['from_offset'] if options['from_offset'] is not None else outbox.get_offset(options['consumer'])
+        while True:
+            records = reader.read(offset, options['batch_size'])
+            for record in records:
+                if not options['topic'] or record['topic'] in options['topic']:
+                    self.stdout.write(json.dumps(record))
+            if records:
+                offset = records[-1]['offset'] + 1
+                outbox.commit_offset(options['consumer'], offset)
+            elif not options['follow']:
+                break
+            else:
+                time.sleep(1)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_profile_referred_by'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='description',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_payment_status_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wallet',
+            name='is_sharded',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='WalletShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField()),
+                ('balance', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='core.wallet')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('wallet', 'index'), name='unique_wallet_shard')],
+            },
+        ),
+    ]
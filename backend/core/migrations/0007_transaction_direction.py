@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:37
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def backfill_direction(apps, schema_editor):
+    Transaction = apps.get_model('core', 'Transaction')
+    Transaction.objects.filter(type='withdrawal').update(direction='debit')
+
+    # transfer_funds writes the sender's row first, then the recipient's,
+    # so in each matching pair the lower id is the debit
+    unmatched = defaultdict(list)
+    debit_ids = []
+    rows = (
+        Transaction.objects.filter(type='transfer', recipient__isnull=False)
+        .order_by('id')
+        .values_list('id', 'wallet__profile_id', 'recipient_id', 'amount')
+    )
+    for tx_id, owner_id, counterpart_id, amount in rows.iterator():
+        partners = unmatched.get((counterpart_id, owner_id, amount))
+        if partners:
+            debit_ids.append(partners.pop(0))
+        else:
+            unmatched[(owner_id, counterpart_id, amount)].append(tx_id)
+    for i in range(0, len(debit_ids), 1000):
+        Transaction.objects.filter(id__in=debit_ids[i:i + 1000]).update(direction='debit')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_wallet_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='direction',
+            field=models.CharField(choices=[('credit', 'Credit'), ('debit', 'Debit')], default='credit', max_length=6),
+        ),
+        migrations.RunPython(backfill_direction, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_transaction_direction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateTimeField()),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('last_transaction_id', models.BigIntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='balance_after',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['wallet', 'id'], name='transaction_wallet_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['wallet', 'timestamp'], name='transaction_wallet_ts_idx'),
+        ),
+        migrations.AddField(
+            model_name='balancecheckpoint',
+            name='wallet',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='core.wallet'),
+        ),
+        migrations.AddIndex(
+            model_name='balancecheckpoint',
+            index=models.Index(fields=['wallet', 'as_of'], name='checkpoint_wallet_as_of_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='balancecheckpoint',
+            index=models.Index(fields=['wallet', 'last_transaction_id'], name='checkpoint_wallet_last_tx_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_balance_checkpoints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('city', models.CharField(max_length=100)),
+                ('signups', models.PositiveIntegerField(default=0)),
+                ('referred_signups', models.PositiveIntegerField(default=0)),
+                ('referred_activations', models.PositiveIntegerField(default=0)),
+                ('activations', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('payouts', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('transfer_volume', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['timestamp'], name='transaction_timestamp_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'city'), name='unique_daily_rollup'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:47
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountPurge',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('profile_id', models.BigIntegerField(unique=True)),
+                ('requested_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('stage', models.CharField(default='pending', max_length=40)),
+                ('rows_purged', models.BigIntegerField(default=0)),
+                ('completed_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
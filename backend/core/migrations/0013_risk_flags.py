@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:54
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_notifications'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RiskFlag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reason', models.CharField(choices=[('referral_funnel', 'Referral funnel'), ('cycle', 'Transfer cycle')], max_length=20)),
+                ('details', models.JSONField(default=dict)),
+                ('reviewed', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='risk_flags', to='core.profile')),
+            ],
+        ),
+    ]
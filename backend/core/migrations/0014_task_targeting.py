@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:55
+
+from django.db import migrations, models
+from django.db.models import Min, OuterRef, Subquery
+
+
+def backfill_activated_at(apps, schema_editor):
+    Payment = apps.get_model('core', 'Payment')
+    Profile = apps.get_model('core', 'Profile')
+    first_payment = (
+        Payment.objects.filter(profile=OuterRef('pk'), status='completed')
+        .values('profile').annotate(first=Min('created_at')).values('first')
+    )
+    Profile.objects.filter(is_activated=True, activated_at__isnull=True).update(
+        activated_at=Subquery(first_payment)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_risk_flags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='activated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='target_cities',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='target_cohort',
+            field=models.CharField(blank=True, choices=[('', 'Everyone'), ('new', 'Recently activated'), ('established', 'Established')], max_length=20),
+        ),
+        migrations.RunPython(backfill_activated_at, migrations.RunPython.noop),
+    ]
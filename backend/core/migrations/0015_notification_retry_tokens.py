@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_task_targeting'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='retry_tokens',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
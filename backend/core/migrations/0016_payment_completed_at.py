@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-19 19:40
+
+from django.db import migrations, models
+
+
+def backfill_completed_at(apps, schema_editor):
+    # Best guess for payments completed before the column existed
+    Payment = apps.get_model('core', 'Payment')
+    Payment.objects.filter(status='completed', completed_at__isnull=True).update(completed_at=models.F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_notification_retry_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(backfill_completed_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-19 19:55
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_shard_count(apps, schema_editor):
+    Wallet = apps.get_model('core', 'Wallet')
+    for wallet in Wallet.objects.filter(is_sharded=True).annotate(shards_made=Count('shards')):
+        Wallet.objects.filter(pk=wallet.pk).update(shard_count=wallet.shards_made)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_payment_completed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wallet',
+            name='shard_count',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_shard_count, migrations.RunPython.noop),
+    ]
@@ -18,6 +18,7 @@ class Profile(models.Model):
     referral_code = models.CharField(max_length=10, unique=True, default=generate_referral_code)
     referred_by = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='referrals')
     is_activated = models.BooleanField(default=False)
+    activated_at = models.DateTimeField(null=True, blank=True)
     theme_preference = models.CharField(
         max_length=10,
         choices=[('light', 'Light'), ('dark', 'Dark'), ('system', 'System')],
@@ -25,6 +26,8 @@ class Profile(models.Model):
     )
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
+    # Set when the account is deleted; purge_deleted_accounts removes the row later
+    deleted_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.firebase_uid})"
@@ -32,10 +35,26 @@ class Profile(models.Model):
 class Wallet(models.Model):
     profile = models.OneToOneField(Profile, on_delete=models.CASCADE, related_name='wallet')
     balance = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    # Hot wallets take credits on WalletShard rows instead of this one
+    is_sharded = models.BooleanField(default=False)
+    shard_count = models.PositiveSmallIntegerField(default=0)  # shards 0..shard_count-1 exist
 
     def __str__(self):
         return f"Wallet of {self.profile}"
 
+class WalletShard(models.Model):
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='shards')
+    index = models.PositiveSmallIntegerField()
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['wallet', 'index'], name='unique_wallet_shard'),
+        ]
+
+    def __str__(self):
+        return f"Shard {self.index} of {self.wallet}"
+
 class Task(models.Model):
     STATUS_CHOICES = [
         ('available', 'Available'),
@@ -43,6 +62,11 @@ class Task(models.Model):
         ('approved', 'Approved'),
         ('rejected', 'Rejected'),
     ]
+    COHORT_CHOICES = [
+        ('', 'Everyone'),
+        ('new', 'Recently activated'),
+        ('established', 'Established'),
+    ]
     title = models.CharField(max_length=200)
     description = models.TextField()
     reward_amount = models.DecimalField(max_digits=10, decimal_places=2)
@@ -53,6 +77,9 @@ class Task(models.Model):
     rejection_reason = models.TextField(blank=True)
     expires_at = models.DateTimeField()
     created_at = models.DateTimeField(default=timezone.now)
+    # Targeting: empty means every city / every cohort
+    target_cities = models.JSONField(default=list, blank=True)
+    target_cohort = models.CharField(max_length=20, choices=COHORT_CHOICES, blank=True)
 
     def __str__(self):
         return self.title
@@ -64,6 +91,12 @@ class Payment(models.Model):
     phone_number = models.CharField(max_length=15)
     status = models.CharField(max_length=20, default='pending')  # pending, completed, failed
     created_at = models.DateTimeField(default=timezone.now)
+    completed_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='payment_status_created_idx'),
+        ]
 
 class Transaction(models.Model):
     TYPE_CHOICES = [
@@ -76,9 +109,170 @@ class Transaction(models.Model):
         ('pending', 'Pending'),
         ('completed', 'Completed'),
     ]
+    DIRECTION_CHOICES = [
+        ('credit', 'Credit'),
+        ('debit', 'Debit'),
+    ]
     wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='transactions')
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     type = models.CharField(max_length=20, choices=TYPE_CHOICES)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='completed')
+    direction = models.CharField(max_length=6, choices=DIRECTION_CHOICES, default='credit')
     recipient = models.ForeignKey(Profile, null=True, blank=True, on_delete=models.SET_NULL)  # for transfers
-    timestamp = models.DateTimeField(default=timezone.now)
\ No newline at end of file
+    description = models.CharField(max_length=255, blank=True)
+    # Ledger balance including this row; null until the checkpoint job fills it (sharded wallets)
+    balance_after = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['wallet', 'id'], name='transaction_wallet_id_idx'),
+            models.Index(fields=['wallet', 'timestamp'], name='transaction_wallet_ts_idx'),
+            models.Index(fields=['timestamp'], name='transaction_timestamp_idx'),
+        ]
+
+class BalanceCheckpoint(models.Model):
+    """Ledger balance of a wallet up to and including last_transaction_id."""
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='checkpoints')
+    as_of = models.DateTimeField()
+    balance = models.DecimalField(max_digits=12, decimal_places=2)
+    last_transaction_id = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['wallet', 'as_of'], name='checkpoint_wallet_as_of_idx'),
+            models.Index(fields=['wallet', 'last_transaction_id'], name='checkpoint_wallet_last_tx_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.wallet} at {self.as_of}: {self.balance}"
+
+class IdempotencyKey(models.Model):
+    """Stored outcome of a POST sent with an Idempotency-Key header."""
+    firebase_uid = models.CharField(max_length=255)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)  # null while in flight
+    response_body = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['firebase_uid', 'key'], name='unique_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.firebase_uid})"
+
+class DailyRollup(models.Model):
+    """Pre-aggregated daily metrics per city, maintained by rollup_analytics."""
+    day = models.DateField()
+    city = models.CharField(max_length=100)
+    signups = models.PositiveIntegerField(default=0)
+    referred_signups = models.PositiveIntegerField(default=0)
+    referred_activations = models.PositiveIntegerField(default=0)  # referred users who activated that day
+    activations = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    payouts = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    transfer_volume = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'city'], name='unique_daily_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.city}"
+
+
+class AccountPurge(models.Model):
+    """Progress of purging a deleted (tombstoned) account's rows."""
+    profile_id = models.BigIntegerField(unique=True)
+    requested_at = models.DateTimeField(default=timezone.now)
+    stage = models.CharField(max_length=40, default='pending')
+    rows_purged = models.BigIntegerField(default=0)
+    completed_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    def __str__(self):
+        return f"Purge of profile {self.profile_id} ({self.stage})"
+
+class OutboxEvent(models.Model):
+    """Change event written in the same DB transaction as the change itself."""
+    topic = models.CharField(max_length=40)  # transaction, payment, task
+    event_type = models.CharField(max_length=60)
+    aggregate_id = models.BigIntegerField()
+    payload = models.JSONField()
+    created_at = models.DateTimeField(default=timezone.now)
+    published_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['id'], condition=models.Q(published_at__isnull=True), name='outbox_unpublished_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} #{self.aggregate_id}"
+
+class StreamOffset(models.Model):
+    """Position of a named consumer in the published change stream."""
+    consumer = models.CharField(max_length=100, unique=True)
+    offset = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.consumer} @ {self.offset}"
+
+class DeviceToken(models.Model):
+    """FCM registration token of one of a user's devices."""
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='device_tokens')
+    token = models.CharField(max_length=512, unique=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Device of {self.profile}"
+
+class Notification(models.Model):
+    """Push notification waiting to be sent by send_notifications."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    # null profile = broadcast to every activated user
+    profile = models.ForeignKey(Profile, null=True, blank=True, on_delete=models.CASCADE, related_name='notifications')
+    kind = models.CharField(max_length=40)
+    title = models.CharField(max_length=200)
+    body = models.CharField(max_length=500)
+    data = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Devices that failed transiently last time; a retry only goes to these
+    retry_tokens = models.JSONField(default=list, blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='notification_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}: {self.title}"
+
+class RiskFlag(models.Model):
+    """Suspicious transfer pattern found by flag_transfer_rings, for manual review."""
+    REASON_CHOICES = [
+        ('referral_funnel', 'Referral funnel'),
+        ('cycle', 'Transfer cycle'),
+    ]
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='risk_flags')
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    details = models.JSONField(default=dict)
+    reviewed = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.get_reason_display()}: {self.profile}"
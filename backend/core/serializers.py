@@ -1,8 +1,57 @@
 # kenya-earn/backend/core/serializers.py
 from rest_framework import serializers
-from .models import Profile, Wallet, Task, Payment, Transaction
+from .models import Profile, Wallet, Task, Payment, Transaction, DailyRollup
 
-class ProfileSerializer(serializers.ModelSerializer):
+
+def _split_param(value):
+    return {name.strip() for name in value.split(',') if name.strip()} if value else set()
+
+
+class SparseFieldsetMixin:
+    """
+    Lets clients trim a response with ?fields=a,b or ?exclude=c.
+    Pass the request in the serializer context to enable it.
+    """
+    # Model columns read by non-model (computed) fields
+    sparse_field_sources = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+        kept = self.sparse_field_names(request)
+        for name in list(self.fields):
+            if name not in kept:
+                self.fields.pop(name)
+
+    @classmethod
+    def sparse_field_names(cls, request):
+        names = list(cls.Meta.fields)
+        requested = _split_param(request.GET.get('fields'))
+        excluded = _split_param(request.GET.get('exclude'))
+        if requested:
+            names = [name for name in names if name in requested]
+        return [name for name in names if name not in excluded]
+
+    @classmethod
+    def sparse_queryset(cls, queryset, request):
+        """Narrow the SELECT to the columns the kept fields actually read."""
+        model_fields = {f.name for f in cls.Meta.model._meta.concrete_fields}
+        columns, relations = [], set()
+        for name in cls.sparse_field_names(request):
+            for source in cls.sparse_field_sources.get(name, [name]):
+                if '__' in source:
+                    relations.add(source.split('__')[0])
+                    columns.append(source)
+                elif source in model_fields:
+                    columns.append(source)
+        if relations:
+            queryset = queryset.select_related(*relations)
+        return queryset.only(*columns) if columns else queryset.only('pk')
+
+
+class ProfileSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Profile
         fields = [
@@ -28,12 +77,12 @@ class ProfileCompletionSerializer(serializers.Serializer):
         if value:
             from .models import Profile
             try:
-                Profile.objects.get(referral_code=value)
+                Profile.objects.get(referral_code=value, deleted_at__isnull=True)
             except Profile.DoesNotExist:
                 raise serializers.ValidationError("Invalid referral code.")
         return value
 
-class TaskSerializer(serializers.ModelSerializer):
+class TaskSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Task
         fields = [
@@ -48,12 +97,15 @@ class WalletSerializer(serializers.ModelSerializer):
         model = Wallet
         fields = ['balance']
 
-class TransactionSerializer(serializers.ModelSerializer):
+class TransactionSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     recipient_name = serializers.SerializerMethodField()
+    sparse_field_sources = {
+        'recipient_name': ['recipient__first_name', 'recipient__last_name'],
+    }
 
     class Meta:
         model = Transaction
-        fields = ['id', 'amount', 'type', 'status', 'recipient', 'recipient_name', 'timestamp', 'description']
+        fields = ['id', 'amount', 'type', 'status', 'direction', 'recipient', 'recipient_name', 'timestamp', 'description', 'balance_after']
 
     def get_recipient_name(self, obj):
         if obj.recipient:
@@ -66,4 +118,12 @@ class ActivateSerializer(serializers.Serializer):
     def validate_phone_number(self, value):
         if not value.startswith('254') or len(value) != 12:
             raise serializers.ValidationError("Phone number must be in format 2547XXXXXXXX")
-        return value
\ No newline at end of file
+        return value
+
+class DailyRollupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DailyRollup
+        fields = [
+            'day', 'city', 'signups', 'referred_signups', 'referred_activations',
+            'activations', 'revenue', 'payouts', 'transfer_volume'
+        ]
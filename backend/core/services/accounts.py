@@ -0,0 +1,96 @@
+# kenya-earn/backend/core/services/accounts.py
+"""
+Account deletion in two steps.
+
+tombstone() runs inside the request: it renames the firebase_uid and
+referral code so every lookup misses, wipes personal fields, fails any
+pending payments (so a late webhook can't activate the account) and
+queues an AccountPurge. purge() runs later from purge_deleted_accounts
+and removes the account's rows in bounded batches, each in its own short
+transaction, instead of letting Django's collector load the whole
+cascade into memory.
+"""
+import time
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.models import (
+    AccountPurge, BalanceCheckpoint, DeviceToken, IdempotencyKey, Notification,
+    Payment, Profile, RiskFlag, Task, Transaction, Wallet, WalletShard,
+    generate_referral_code,
+)
+from core.services import outbox, paystack
+
+
+def tombstone(profile):
+    with transaction.atomic():
+        IdempotencyKey.objects.filter(firebase_uid=profile.firebase_uid).delete()
+        DeviceToken.objects.filter(profile_id=profile.pk).delete()
+        # Locked, so a webhook completing one of these waits and then sees deleted_at
+        pending = list(Payment.objects.select_for_update().filter(profile_id=profile.pk, status='pending'))
+        Payment.objects.filter(pk__in=[p.pk for p in pending]).update(status='failed')
+        for payment in pending:
+            payment.status = 'failed'
+            outbox.emit('payment', 'payment.failed', payment.id, paystack.payment_payload(payment))
+        Profile.objects.filter(pk=profile.pk).update(
+            firebase_uid=f"deleted:{profile.pk}",
+            referral_code=generate_referral_code(),
+            first_name='', last_name='', email='', phone_number='',
+            address='', profile_picture='',
+            deleted_at=timezone.now(),
+        )
+        AccountPurge.objects.get_or_create(profile_id=profile.pk)
+
+
+def _batches(queryset, batch_size):
+    """Yield lists of primary keys, batch_size at a time, until the queryset is empty."""
+    while True:
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return
+        yield ids
+
+
+def _steps(profile_id, wallet_id):
+    # Detach other users' rows first, then delete the account's own rows
+    # leaf-first, so nothing is left for the final row deletes to cascade to.
+    yield 'detach_transfers', Transaction.objects.filter(recipient_id=profile_id), {'recipient': None}
+    yield 'detach_tasks', Task.objects.filter(assigned_to_id=profile_id), {'assigned_to': None}
+    yield 'detach_referrals', Profile.objects.filter(referred_by_id=profile_id), {'referred_by': None}
+    if wallet_id is not None:
+        yield 'transactions', Transaction.objects.filter(wallet_id=wallet_id), None
+        yield 'shards', WalletShard.objects.filter(wallet_id=wallet_id), None
+        yield 'checkpoints', BalanceCheckpoint.objects.filter(wallet_id=wallet_id), None
+    yield 'risk_flags', RiskFlag.objects.filter(profile_id=profile_id), None
+    yield 'notifications', Notification.objects.filter(profile_id=profile_id), None
+    yield 'payments', Payment.objects.filter(profile_id=profile_id), None
+    yield 'wallet', Wallet.objects.filter(profile_id=profile_id), None
+    yield 'profile', Profile.objects.filter(pk=profile_id), None
+
+
+def purge(purge_record, batch_size=1000, deadline=None):
+    """
+    Purge one account, resuming where a previous run stopped. Returns True
+    when finished, False if deadline (a time.monotonic() value) ran out.
+    """
+    wallet_id = Wallet.objects.filter(profile_id=purge_record.profile_id).values_list('id', flat=True).first()
+    for stage, queryset, updates in _steps(purge_record.profile_id, wallet_id):
+        for ids in _batches(queryset, batch_size):
+            with transaction.atomic():
+                batch = queryset.model.objects.filter(pk__in=ids)
+                if updates is None:
+                    # Leaf-first order leaves the collector nothing to cascade to,
+                    # so this stays one DELETE plus an empty lookup per relation
+                    count, _ = batch.delete()
+                else:
+                    count = batch.update(**updates)
+                AccountPurge.objects.filter(pk=purge_record.pk).update(
+                    stage=stage, rows_purged=F('rows_purged') + count
+                )
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+
+    AccountPurge.objects.filter(pk=purge_record.pk).update(stage='done', completed_at=timezone.now())
+    return True
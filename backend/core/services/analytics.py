@@ -0,0 +1,107 @@
+# kenya-earn/backend/core/services/analytics.py
+"""
+Daily rollups for the admin dashboard.
+
+Every metric is counted on the day its event happened: signups on
+Profile.created_at, activations on Profile.activated_at and revenue on
+Payment.completed_at. A payment that completes days after the signup adds
+to today's row, which the next run recomputes anyway.
+
+The high-water mark is the newest day already in DailyRollup. Each run
+recomputes from that day (minus a short lookback for rows that commit
+just after a run) up to today, so the ledger is only ever scanned over a
+few days at a time.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.models import DailyRollup, Payment, Profile, Transaction
+
+METRICS = [
+    'signups', 'referred_signups', 'referred_activations',
+    'activations', 'revenue', 'payouts', 'transfer_volume',
+]
+
+
+def _city(name):
+    return (name or '').strip().title() or 'Unknown'
+
+
+def _collect(rows, city_field, into):
+    for row in rows:
+        bucket = into[(row['day'], _city(row[city_field]))]
+        for metric in METRICS:
+            if metric in row:
+                bucket[metric] += row[metric] or 0
+
+
+def compute(start, end):
+    """Metrics keyed by (day, city) for start <= day <= end."""
+    totals = defaultdict(lambda: defaultdict(int))
+    # Plain range bounds so the created_at/timestamp indexes are usable
+    lower = timezone.make_aware(datetime.combine(start, time.min))
+    upper = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))
+
+    def in_window(field):
+        return {f'{field}__gte': lower, f'{field}__lt': upper}
+
+    _collect(
+        Profile.objects.filter(**in_window('created_at'))
+        .values(day=TruncDate('created_at'), city_name=F('city'))
+        .annotate(
+            signups=Count('id'),
+            referred_signups=Count('id', filter=Q(referred_by__isnull=False)),
+        ),
+        'city_name', totals,
+    )
+    _collect(
+        Profile.objects.filter(referred_by__isnull=False, **in_window('activated_at'))
+        .values(day=TruncDate('activated_at'), city_name=F('city'))
+        .annotate(referred_activations=Count('id')),
+        'city_name', totals,
+    )
+    _collect(
+        Payment.objects.filter(status='completed', **in_window('completed_at'))
+        .values(day=TruncDate('completed_at'), city_name=F('profile__city'))
+        .annotate(activations=Count('id'), revenue=Sum('amount')),
+        'city_name', totals,
+    )
+    _collect(
+        Transaction.objects.filter(
+            Q(type='withdrawal') | Q(type='transfer', direction='debit', status='completed'),
+            **in_window('timestamp'),
+        )
+        .values(day=TruncDate('timestamp'), city_name=F('wallet__profile__city'))
+        .annotate(
+            payouts=Sum('amount', filter=Q(type='withdrawal')),
+            transfer_volume=Sum('amount', filter=Q(type='transfer')),
+        ),
+        'city_name', totals,
+    )
+    return totals
+
+
+def refresh_rollups(lookback_days=2, since=None):
+    """Recompute rollups from the high-water mark (or since) through today."""
+    today = timezone.localdate()
+    if since is None:
+        high_water = DailyRollup.objects.aggregate(day=Max('day'))['day']
+        if high_water is not None:
+            since = high_water - timedelta(days=lookback_days)
+        else:
+            first = Profile.objects.aggregate(first=Min('created_at'))['first']
+            since = timezone.localdate(first) if first else today
+
+    totals = compute(since, today)
+    with transaction.atomic():
+        DailyRollup.objects.filter(day__gte=since, day__lte=today).delete()
+        DailyRollup.objects.bulk_create(
+            [DailyRollup(day=day, city=city, **metrics) for (day, city), metrics in totals.items()],
+            batch_size=1000,
+        )
+    return since, len(totals)
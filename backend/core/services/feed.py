@@ -0,0 +1,123 @@
+# kenya-earn/backend/core/services/feed.py
+"""
+Per-segment task feeds kept in the cache.
+
+A segment is a (city, activation cohort) pair. Its candidate list holds
+(task id, created_at, expires_at) for every available task targeted at
+it, newest first, built with one query the first time the segment is
+read. Expired entries are dropped as the list is read.
+
+Every list key carries a global feed version. Saving or deleting any Task
+(admin, views, shell, imports: it's a post_save/post_delete signal, see
+core.signals) bumps the version once the transaction commits, so every
+segment rebuilds on its next read. There is no shared registry to keep in
+sync, and bumping is a single atomic incr. Serving still re-checks status
+and expiry on the primary-key fetch, so a list can never show a task that
+is no longer available.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import Profile, Task
+
+FEED_TTL = 15 * 60
+VERSION_KEY = 'feed:version'
+
+
+def normalize_city(city):
+    return ' '.join((city or '').split()).casefold()
+
+
+def cohort_for(profile):
+    if profile.activated_at and timezone.now() - profile.activated_at < timedelta(days=settings.TASK_NEW_USER_DAYS):
+        return 'new'
+    return 'established'
+
+
+def segment_for(profile):
+    return normalize_city(profile.city), cohort_for(profile)
+
+
+def _version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Evicted (or first use): start from a value no old list key can have
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def _key(segment, version):
+    city, cohort = segment
+    return f"feed:{version}:{cohort}:{city}"
+
+
+def _matches(task, segment):
+    city, cohort = segment
+    cities = {normalize_city(c) for c in task.target_cities}
+    return (not cities or city in cities) and task.target_cohort in ('', cohort)
+
+
+def _entry(task):
+    return [task.id, task.created_at.timestamp(), task.expires_at.timestamp()]
+
+
+def _build(segment, version):
+    tasks = Task.objects.filter(status='available', expires_at__gt=timezone.now()).only(
+        'id', 'created_at', 'expires_at', 'target_cities', 'target_cohort'
+    )
+    entries = sorted((_entry(t) for t in tasks if _matches(t, segment)), key=lambda e: -e[1])
+    cache.set(_key(segment, version), entries, FEED_TTL)
+    return entries
+
+
+def candidate_ids(profile, limit=None):
+    """Ids of the available tasks targeted at this profile's segment, newest first."""
+    segment = segment_for(profile)
+    # Read the version before the tasks, so a list built from a snapshot
+    # older than a bump is stored under the old version and never served
+    version = _version()
+    entries = cache.get(_key(segment, version))
+    if entries is None:
+        entries = _build(segment, version)
+
+    now = timezone.now().timestamp()
+    live = [e for e in entries if e[2] > now]
+    if len(live) != len(entries):
+        cache.set(_key(segment, version), live, FEED_TTL)
+    return [e[0] for e in live[:limit]]
+
+
+def tasks_for(profile, queryset=None, limit=None):
+    """The profile's feed as a queryset, in candidate order."""
+    ids = candidate_ids(profile, limit)
+    order = {task_id: i for i, task_id in enumerate(ids)}
+    queryset = Task.objects.all() if queryset is None else queryset
+    tasks = queryset.filter(id__in=ids, status='available', expires_at__gt=timezone.now())
+    return sorted(tasks, key=lambda t: order[t.id])
+
+
+def audience(task):
+    """Ids of the activated profiles with a device whose feed would show this task."""
+    profiles = (
+        Profile.objects.filter(is_activated=True, deleted_at__isnull=True, device_tokens__isnull=False)
+        .distinct().only('id', 'city', 'activated_at')
+    )
+    return [p.id for p in profiles.iterator() if _matches(task, segment_for(p))]
+
+
+def invalidate():
+    """Retire every cached list once the surrounding transaction commits."""
+    transaction.on_commit(_bump)
+
+
+def _bump():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), None)
@@ -0,0 +1,64 @@
+# kenya-earn/backend/core/services/health.py
+"""
+Readiness checks for /readyz.
+
+The Firebase check asks whether ID tokens can be verified: the app is
+initialised and we hold an unexpired copy of Google's token-signing
+certificates. The certificates are refetched shortly before the copy
+lapses (their Cache-Control max-age is several hours), by one thread at a
+time; other probes keep answering from the copy we have, so a probe only
+fails once that copy has actually expired.
+"""
+import re
+import threading
+import time
+
+import firebase_admin
+import requests
+from django.db import DatabaseError, connection
+
+CERTS_URL = 'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com'
+MAX_AGE = re.compile(r'max-age=(\d+)')
+REFRESH_MARGIN = 300  # seconds before expiry to start refetching
+
+_certs_expire_at = 0.0
+_refresh_lock = threading.Lock()
+
+
+def check_database():
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except DatabaseError as e:
+        return str(e)
+    return None
+
+
+def _refresh_certs():
+    global _certs_expire_at
+    response = requests.get(CERTS_URL, timeout=2)
+    response.raise_for_status()
+    match = MAX_AGE.search(response.headers.get('Cache-Control', ''))
+    _certs_expire_at = time.time() + (int(match.group(1)) if match else 3600)
+
+
+def check_firebase():
+    try:
+        firebase_admin.get_app()
+    except ValueError:
+        return 'Firebase app not initialised'
+
+    if _certs_expire_at - REFRESH_MARGIN > time.time():
+        return None
+    # Only one probe refreshes; the rest answer from the copy we have
+    if not _refresh_lock.acquire(blocking=False):
+        return None if _certs_expire_at > time.time() else 'Token certificates expired; refresh in progress'
+    try:
+        _refresh_certs()
+    except requests.RequestException as e:
+        if _certs_expire_at > time.time():
+            return None  # still valid; the next probe tries again
+        return f"Could not fetch token certificates: {e}"
+    finally:
+        _refresh_lock.release()
+    return None
@@ -8,7 +8,7 @@ def get_mpesa_access_token():
     consumer_key = settings.MPESA_CONFIG['CONSUMER_KEY']
     consumer_secret = settings.MPESA_CONFIG['CONSUMER_SECRET']
     api_url = 'https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials'
-    r = requests.get(api_url, auth=(consumer_key, consumer_secret))
+    r = requests.get(api_url, auth=(consumer_key, consumer_secret), timeout=15)
     return r.json().get('access_token')
 
 def lipa_na_mpesa_online(phone_number, amount, account_reference):
@@ -41,6 +41,34 @@ def lipa_na_mpesa_online(phone_number, amount, account_reference):
     response = requests.post(
         'https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest',
         json=payload,
-        headers=headers
+        headers=headers,
+        timeout=15
     )
-    return response.json()
\ No newline at end of file
+    return response.json()
+
+def stk_push_query(checkout_request_id, access_token=None):
+    access_token = access_token or get_mpesa_access_token()
+    if not access_token:
+        return {'error': 'Could not get access token'}
+
+    shortcode = settings.MPESA_CONFIG['SHORTCODE']
+    passkey = settings.MPESA_CONFIG['PASSKEY']
+
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    password = base64.b64encode((shortcode + passkey + timestamp).encode()).decode()
+
+    payload = {
+        "BusinessShortCode": shortcode,
+        "Password": password,
+        "Timestamp": timestamp,
+        "CheckoutRequestID": checkout_request_id,
+    }
+
+    headers = {"Authorization": f"Bearer {access_token}"}
+    response = requests.post(
+        'https://sandbox.safaricom.co.ke/mpesa/stkpushquery/v1/query',
+        json=payload,
+        headers=headers,
+        timeout=15
+    )
+    return response.json()
@@ -0,0 +1,226 @@
+# kenya-earn/backend/core/services/notifications.py
+"""
+Push notifications, sent outside the request path.
+
+Views and services call notify() inside their own transaction; that only
+inserts a Notification row. send_due() (run by send_notifications) claims
+due rows, folds several pending notifications for the same user into one
+push, and hands pushes to the configured sender in batches of up to
+FCM's 500-message limit, a few batches in flight at a time. The claim
+is a lease on the rows, renewed after every batch so a long broadcast
+isn't picked up by a second worker. Devices that failed transiently are
+remembered on the notification and retried, with exponential backoff,
+without re-sending to the ones that already got it.
+"""
+import random
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core.models import DeviceToken, Notification
+
+MAX_BATCH = 500  # FCM send_each / multicast limit
+LEASE = timedelta(minutes=5)  # how long a claimed row stays hidden without a renewal
+
+# What a sender reports for each push that didn't go through
+RETRIABLE = 'retriable'  # try this device again later
+DEAD_TOKEN = 'dead-token'  # the token will never work again; forget it
+FAILED = 'failed'  # permanent for this push, e.g. an invalid payload
+
+Push = namedtuple('Push', ['token', 'title', 'body', 'data'])
+
+
+def _data(data):
+    return {key: str(value) for key, value in (data or {}).items()}  # FCM data values must be strings
+
+
+def notify(profile, kind, title, body, data=None):
+    """Queue a push for one user, or for every activated user if profile is None."""
+    return Notification.objects.create(profile=profile, kind=kind, title=title, body=body, data=_data(data))
+
+
+def notify_each(profile_ids, kind, title, body, data=None):
+    """Queue the same push for each of these users (a targeted broadcast)."""
+    return Notification.objects.bulk_create(
+        [Notification(profile_id=pid, kind=kind, title=title, body=body, data=_data(data)) for pid in profile_ids],
+        batch_size=1000,
+    )
+
+
+# -------------------------
+# SENDERS
+# -------------------------
+
+class FirebaseSender:
+    """Sends through the firebase_admin app initialised in kenya_earn.middleware."""
+
+    @staticmethod
+    def classify(error):
+        from firebase_admin import exceptions, messaging
+
+        if isinstance(error, (messaging.UnregisteredError, messaging.SenderIdMismatchError)):
+            return DEAD_TOKEN
+        if isinstance(error, (
+            messaging.QuotaExceededError, exceptions.UnavailableError,
+            exceptions.InternalError, exceptions.DeadlineExceededError, exceptions.UnknownError,
+        )):
+            return RETRIABLE
+        return FAILED
+
+    def send(self, pushes):
+        """Send up to MAX_BATCH pushes; returns None or RETRIABLE / DEAD_TOKEN / FAILED per push."""
+        from firebase_admin import messaging
+
+        first = pushes[0]
+        if all((p.title, p.body, p.data) == (first.title, first.body, first.data) for p in pushes):
+            response = messaging.send_each_for_multicast(messaging.MulticastMessage(
+                tokens=[p.token for p in pushes],
+                notification=messaging.Notification(title=first.title, body=first.body),
+                data=first.data,
+            ))
+        else:
+            response = messaging.send_each([
+                messaging.Message(
+                    token=p.token,
+                    notification=messaging.Notification(title=p.title, body=p.body),
+                    data=p.data,
+                )
+                for p in pushes
+            ])
+        return [None if r.success else self.classify(r.exception) for r in response.responses]
+
+
+class FakeSender:
+    """Records pushes instead of sending them, for offline throughput tests."""
+
+    def __init__(self, latency=0.0, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sent = []
+
+    def send(self, pushes):
+        time.sleep(self.latency)
+        results = [RETRIABLE if random.random() < self.failure_rate else None for _ in pushes]
+        self.sent.extend(p for p, error in zip(pushes, results) if error is None)
+        return results
+
+
+def get_sender():
+    options = getattr(settings, 'NOTIFICATION_SENDER_OPTIONS', {})
+    return import_string(settings.NOTIFICATION_SENDER)(**options)
+
+
+# -------------------------
+# WORKER
+# -------------------------
+
+def _claim(limit):
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            Notification.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('id')[:limit]
+        )
+        Notification.objects.filter(id__in=[n.id for n in rows]).update(next_attempt_at=now + LEASE)
+    return rows
+
+
+def _pushes_for(notifications):
+    """
+    Turn claimed notifications into pushes. Returns a list of (push, notification ids)
+    so send results can be traced back to the rows they came from. A notification
+    being retried only goes to the devices listed in its retry_tokens.
+    """
+    personal = defaultdict(list)
+    broadcasts = []
+    for n in notifications:
+        if n.profile_id:
+            personal[n.profile_id].append(n)
+        else:
+            broadcasts.append(n)
+
+    tokens = defaultdict(list)
+    for profile_id, token in DeviceToken.objects.filter(profile_id__in=personal).values_list('profile_id', 'token'):
+        tokens[profile_id].append(token)
+
+    pushes = []
+    for profile_id, items in personal.items():
+        # Coalesce: one push per user however many events piled up
+        if len(items) == 1:
+            title, body, data = items[0].title, items[0].body, items[0].data
+        else:
+            title = f"{len(items)} new updates"
+            body = '; '.join(n.title for n in items[-3:])
+            data = {'kind': 'digest', 'count': str(len(items))}
+        targets = tokens[profile_id]
+        if all(n.retry_tokens for n in items):
+            # Only retries: skip devices that already have them. Anything new goes everywhere.
+            retry_tokens = {token for n in items for token in n.retry_tokens}
+            targets = [token for token in targets if token in retry_tokens]
+        ids = [n.id for n in items]
+        pushes.extend((Push(token, title, body, data), ids) for token in targets)
+
+    if broadcasts:
+        broadcast_tokens = DeviceToken.objects.filter(
+            profile__is_activated=True, profile__deleted_at__isnull=True
+        ).values_list('token', flat=True)
+        for n in broadcasts:
+            targets = n.retry_tokens or broadcast_tokens.iterator()
+            pushes.extend((Push(token, n.title, n.body, n.data), [n.id]) for token in targets)
+    return pushes
+
+
+def send_due(sender, limit=1000, concurrency=4, max_attempts=5):
+    """Send one round of due notifications. Returns (notifications handled, pushes sent)."""
+    notifications = _claim(limit)
+    if not notifications:
+        return 0, 0
+    claimed_ids = [n.id for n in notifications]
+
+    pushes = _pushes_for(notifications)
+    batches = [pushes[i:i + MAX_BATCH] for i in range(0, len(pushes), MAX_BATCH)]
+
+    def send(batch):
+        try:
+            return sender.send([push for push, _ in batch])
+        except Exception:
+            return [RETRIABLE] * len(batch)
+
+    retry_tokens = defaultdict(set)
+    dead_tokens = []
+    sent = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for batch, errors in zip(batches, pool.map(send, batches)):
+            for (push, ids), error in zip(batch, errors):
+                if error is None:
+                    sent += 1
+                elif error == DEAD_TOKEN:
+                    dead_tokens.append(push.token)
+                elif error == RETRIABLE:
+                    for notification_id in ids:
+                        retry_tokens[notification_id].add(push.token)
+            # Keep the rows hidden from other workers while the rest goes out
+            Notification.objects.filter(id__in=claimed_ids).update(next_attempt_at=timezone.now() + LEASE)
+
+    now = timezone.now()
+    done = [n.id for n in notifications if n.id not in retry_tokens]
+    with transaction.atomic():
+        Notification.objects.filter(id__in=done).update(status='sent', sent_at=now, retry_tokens=[])
+        for n in notifications:
+            if n.id in retry_tokens:
+                attempts = n.attempts + 1
+                Notification.objects.filter(id=n.id).update(
+                    attempts=attempts,
+                    status='failed' if attempts >= max_attempts else 'pending',
+                    next_attempt_at=now + timedelta(seconds=30 * 2 ** attempts),
+                    retry_tokens=sorted(retry_tokens[n.id]),
+                )
+        DeviceToken.objects.filter(token__in=dead_tokens).delete()
+    return len(notifications), sent
@@ -0,0 +1,225 @@
+# kenya-earn/backend/core/services/outbox.py
+"""
+Transactional outbox and the change stream fed from it.
+
+Ledger code calls emit() inside its own transaction, so an event exists if
+and only if the change committed. relay() later publishes unpublished
+events in id order to the sink configured by OUTBOX_SINK. Delivery is
+at-least-once; consumers can drop duplicates by event 'id'. Run a single
+relay process so the stream keeps outbox order.
+"""
+import json
+import os
+import queue
+from bisect import bisect_right
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core.models import OutboxEvent, StreamOffset
+
+
+def emit(topic, event_type, aggregate_id, payload):
+    return OutboxEvent.objects.create(
+        topic=topic,
+        event_type=event_type,
+        aggregate_id=aggregate_id,
+        payload=json.loads(json.dumps(payload, cls=DjangoJSONEncoder)),
+    )
+
+
+def transaction_payload(tx):
+    return {
+        'id': tx.id,
+        'wallet_id': tx.wallet_id,
+        'profile_id': tx.wallet.profile_id,
+        'amount': tx.amount,
+        'type': tx.type,
+        'status': tx.status,
+        'direction': tx.direction,
+        'recipient_id': tx.recipient_id,
+        'balance_after': tx.balance_after,
+        'timestamp': tx.timestamp,
+    }
+
+
+def _as_record(event):
+    return {
+        'id': event.id,
+        'topic': event.topic,
+        'type': event.event_type,
+        'aggregate_id': event.aggregate_id,
+        'payload': event.payload,
+        'created_at': event.created_at.isoformat(),
+    }
+
+
+# -------------------------
+# SINKS
+# -------------------------
+
+class Sink:
+    def publish(self, records):
+        """Durably hand over a batch of records, or raise."""
+        raise NotImplementedError
+
+    @classmethod
+    def open_reader(cls, **options):
+        """
+        A reader for what a sink built with these options has published,
+        usable from another process. Sinks that can't be read back raise
+        NotImplementedError.
+        """
+        raise NotImplementedError(f"{cls.__name__} can't be read back")
+
+
+class QueueSink(Sink):
+    """In-process queue, for consumers living in the same process (and tests)."""
+
+    def __init__(self, maxsize=0):
+        self.queue = queue.Queue(maxsize)
+
+    def publish(self, records):
+        for record in records:
+            self.queue.put(record)
+
+
+class SegmentedFileSink(Sink):
+    """
+    Append-only log of JSON lines split into segment files named after the
+    offset of their first record. Every record gets a stream offset that
+    consumers store to resume from.
+    """
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024):
+        self.directory = str(directory)
+        self.segment_bytes = segment_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        self.next_offset = self._recover_next_offset()
+
+    @classmethod
+    def open_reader(cls, directory, **options):
+        # Not via __init__: recovery truncates, which only the writer may do
+        return SegmentedFileReader(directory)
+
+    def _segments(self):
+        return sorted(int(name[:-4]) for name in os.listdir(self.directory) if name.endswith('.log'))
+
+    def _path(self, base):
+        return os.path.join(self.directory, f"{base:020d}.log")
+
+    def _recover_next_offset(self):
+        segments = self._segments()
+        if not segments:
+            return 0
+        count = end = 0
+        with open(self._path(segments[-1]), 'rb+') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                count += 1
+                end += len(line)
+            # A crash mid-write leaves a torn last line. Its events were never
+            # marked published, so drop it and let the relay write them again.
+            f.truncate(end)
+        return segments[-1] + count
+
+    def publish(self, records):
+        if not records:
+            return
+        segments = self._segments()
+        path = self._path(segments[-1]) if segments else None
+        if path is None or os.path.getsize(path) >= self.segment_bytes:
+            path = self._path(self.next_offset)
+
+        lines = []
+        for i, record in enumerate(records):
+            lines.append(json.dumps(dict(record, offset=self.next_offset + i), cls=DjangoJSONEncoder) + '\n')
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(''.join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        self.next_offset += len(records)
+
+
+class SegmentedFileReader:
+    """
+    Reads a SegmentedFileSink directory from a given offset. Remembers where
+    the last read stopped, so tailing with the returned offsets never rescans.
+    """
+
+    def __init__(self, directory):
+        self.directory = str(directory)
+        self._resume = None  # (offset, segment base, byte position)
+
+    def read(self, offset, limit=1000):
+        segments = sorted(int(name[:-4]) for name in os.listdir(self.directory) if name.endswith('.log'))
+        if not segments:
+            return []
+
+        if self._resume and self._resume[0] == offset:
+            _, base, byte_position = self._resume
+            position = offset
+        else:
+            base = segments[max(bisect_right(segments, offset) - 1, 0)]
+            byte_position, position = 0, base
+
+        records = []
+        for i, base in enumerate(segments[segments.index(base):]):
+            if i:
+                # Segments are contiguous: the next one starts where this one ended
+                byte_position, position = 0, base
+            with open(os.path.join(self.directory, f"{base:020d}.log"), 'rb') as f:
+                f.seek(byte_position)
+                while len(records) < limit:
+                    line = f.readline()
+                    if not line.endswith(b'\n'):
+                        break  # end of segment, or a write still in progress
+                    if position >= offset:
+                        records.append(json.loads(line))
+                    position += 1
+                byte_position = f.tell() - (0 if not line or line.endswith(b'\n') else len(line))
+            self._resume = (position, base, byte_position)
+            if len(records) >= limit:
+                break
+        return records
+
+
+def get_sink():
+    options = getattr(settings, 'OUTBOX_SINK_OPTIONS', {})
+    return import_string(settings.OUTBOX_SINK)(**options)
+
+
+def get_reader():
+    """A reader for the configured sink; raises NotImplementedError if it can't be read back."""
+    options = getattr(settings, 'OUTBOX_SINK_OPTIONS', {})
+    return import_string(settings.OUTBOX_SINK).open_reader(**options)
+
+
+# -------------------------
+# RELAY & CONSUMERS
+# -------------------------
+
+def relay(sink, batch_size=500):
+    """Publish one batch of unpublished events. Returns how many were sent."""
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update()
+            .filter(published_at__isnull=True).order_by('id')[:batch_size]
+        )
+        if not events:
+            return 0
+        sink.publish([_as_record(event) for event in events])
+        OutboxEvent.objects.filter(id__in=[e.id for e in events]).update(published_at=timezone.now())
+    return len(events)
+
+
+def get_offset(consumer):
+    return StreamOffset.objects.filter(consumer=consumer).values_list('offset', flat=True).first() or 0
+
+
+def commit_offset(consumer, offset):
+    StreamOffset.objects.update_or_create(consumer=consumer, defaults={'offset': offset})
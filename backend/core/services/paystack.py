@@ -0,0 +1,103 @@
+# kenya-earn/backend/core/services/paystack.py
+from decimal import Decimal
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import Payment, Transaction
+from core.services import notifications, outbox, wallets
+
+ACTIVATION_FEE = 300  # KES
+
+
+def verify_transaction(reference, session=None):
+    """Ask Paystack for the current state of a transaction."""
+    http = session or requests
+    response = http.get(
+        f"{settings.PAYSTACK_API_BASE}/transaction/verify/{reference}",
+        headers={"Authorization": f"Bearer {settings.PAYSTACK_SECRET_KEY}"},
+        timeout=15,
+    )
+    return response.json()
+
+
+def payment_payload(payment):
+    return {
+        'id': payment.id,
+        'profile_id': payment.profile_id,
+        'reference': payment.mpesa_checkout_id,
+        'amount': payment.amount,
+        'status': payment.status,
+    }
+
+
+def complete_activation(reference, amount_paid):
+    """
+    Mark the payment with this reference completed and activate its profile.
+    Both the webhook and the reconciler call this, so it is safe to run more
+    than once for the same reference. Returns False if no payment matches.
+    """
+    with transaction.atomic():
+        try:
+            payment = Payment.objects.select_for_update().get(mpesa_checkout_id=reference)
+        except Payment.DoesNotExist:
+            return False
+
+        # Only activate if amount is at least Ksh 300
+        if payment.status == 'completed' or amount_paid < ACTIVATION_FEE:
+            return True
+        # The account was deleted while the payment was pending
+        if payment.profile.deleted_at is not None:
+            return True
+
+        payment.status = 'completed'
+        payment.completed_at = timezone.now()
+        payment.save()
+        outbox.emit('payment', 'payment.completed', payment.id, payment_payload(payment))
+
+        profile = payment.profile
+        profile.is_activated = True
+        profile.activated_at = timezone.now()
+        profile.save()
+        notifications.notify(profile, 'payment.completed', "Account activated", "Your payment was received. Start earning now!")
+
+        # Handle referral bonus
+        if profile.referred_by:
+            try:
+                # Savepoint so a bonus failure doesn't abort the activation
+                with transaction.atomic():
+                    referrer = profile.referred_by
+                    pending_bonus = Transaction.objects.filter(
+                        wallet=referrer.wallet,
+                        amount=50.00,
+                        type='deposit',
+                        status='pending',
+                        description__icontains=profile.first_name
+                    ).first()
+                    if pending_bonus:
+                        wallets.complete_pending_deposit(pending_bonus)
+                    else:
+                        # Credit first, as transfer() does: on a sharded wallet the
+                        # shard lock then covers the new ledger row's id
+                        wallets.credit(referrer.wallet, Decimal('50.00'))
+                        wallets.record_transaction(
+                            referrer.wallet,
+                            amount=50.00,
+                            type='deposit',
+                            status='completed',
+                            description=f"{profile.first_name} used your code"
+                        )
+                    notifications.notify(referrer, 'referral.bonus', "Referral bonus", f"{profile.first_name} joined with your code. KES 50 added.")
+            except Exception as e:
+                print(f"Referral bonus error: {e}")
+
+        # Record activation transaction
+        wallets.record_transaction(
+            profile.wallet,
+            amount=payment.amount,
+            type='activation',
+            status='completed'
+        )
+    return True
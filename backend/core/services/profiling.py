@@ -0,0 +1,182 @@
+# kenya-earn/backend/core/services/profiling.py
+"""
+Per-request profiling reports, kept in a bounded directory on disk.
+
+ProfilingMiddleware (kenya_earn.middleware) runs a request under
+pyinstrument when it is installed, or cProfile otherwise, and records
+every SQL query with the line of project code that issued it. Each report
+is a <id>.json metadata file plus its profiler output: HTML and speedscope
+JSON from pyinstrument, or pstats text and a .prof dump from cProfile.
+Only the newest PROFILING_MAX_REPORTS are kept.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import time
+import traceback
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+
+try:
+    from pyinstrument import Profiler
+    from pyinstrument.renderers import SpeedscopeRenderer
+except ImportError:  # pyinstrument is optional; fall back to cProfile
+    Profiler = None
+
+TOKEN_SALT = 'kenya_earn.profiling'
+REPORT_ID = re.compile(r'^\d{20}$')
+ARTIFACT_TYPES = {
+    'html': 'text/html',
+    'speedscope.json': 'application/json',
+    'txt': 'text/plain',
+    'prof': 'application/octet-stream',
+}
+MAX_QUERIES = 1000
+PROJECT_DIR = str(settings.BASE_DIR)
+
+
+def make_token(issued_to, minutes=60):
+    return signing.dumps({'by': issued_to, 'exp': time.time() + minutes * 60}, salt=TOKEN_SALT)
+
+
+def check_token(token):
+    """Return who the token was issued to, or None if it is forged or expired."""
+    try:
+        data = signing.loads(token, salt=TOKEN_SALT)
+    except signing.BadSignature:
+        return None
+    return data['by'] if data.get('exp', 0) > time.time() else None
+
+
+def _origin():
+    # Innermost frame in our own code, skipping this module and installed packages
+    for frame in reversed(traceback.extract_stack()[:-2]):
+        if (frame.filename.startswith(PROJECT_DIR) and 'site-packages' not in frame.filename
+                and frame.filename != __file__):
+            return f"{os.path.relpath(frame.filename, PROJECT_DIR)}:{frame.lineno} in {frame.name}"
+    return None
+
+
+class SqlRecorder:
+    """connection.execute_wrapper that times each query and notes where it came from."""
+
+    def __init__(self):
+        self.queries = []
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            if len(self.queries) < MAX_QUERIES:
+                self.queries.append({
+                    'sql': sql,
+                    'ms': round((time.perf_counter() - started) * 1000, 3),
+                    'origin': _origin(),
+                })
+
+
+def profile_request(get_response, request, trigger):
+    """Run get_response(request) under the profiler and save a report. Returns (response, report id)."""
+    recorder = SqlRecorder()
+    if Profiler:
+        profiler = Profiler(interval=0.001, async_mode='disabled')
+        start, stop = profiler.start, profiler.stop
+    else:
+        profiler = cProfile.Profile()
+        start, stop = profiler.enable, profiler.disable
+
+    started = time.perf_counter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        start()
+        try:
+            response = get_response(request)
+        finally:
+            stop()
+    duration = time.perf_counter() - started
+
+    meta = {
+        'method': request.method,
+        'path': request.get_full_path(),
+        'status': response.status_code,
+        'ms': round(duration * 1000, 1),
+        'trigger': trigger,
+        'profiler': 'pyinstrument' if Profiler else 'cProfile',
+        'created_at': time.time(),
+        'query_count': recorder.count,
+        'sql_ms': round(sum(q['ms'] for q in recorder.queries), 3),
+        'queries': recorder.queries,
+    }
+    return response, save_report(meta, profiler)
+
+
+def save_report(meta, profiler):
+    directory = Path(settings.PROFILING_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    report_id = f"{time.time_ns():020d}"
+
+    if Profiler:
+        (directory / f"{report_id}.html").write_text(profiler.output_html())
+        (directory / f"{report_id}.speedscope.json").write_text(profiler.output(SpeedscopeRenderer()))
+        meta['artifacts'] = ['html', 'speedscope.json']
+    else:
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(60)
+        (directory / f"{report_id}.txt").write_text(text.getvalue())
+        profiler.dump_stats(directory / f"{report_id}.prof")
+        meta['artifacts'] = ['txt', 'prof']
+
+    # Metadata last: a report only shows up once all its files exist
+    (directory / f"{report_id}.json").write_text(json.dumps(meta))
+    _trim(directory)
+    return report_id
+
+
+def _trim(directory):
+    reports = sorted(p.stem for p in directory.glob('*.json') if REPORT_ID.match(p.stem))
+    for report_id in reports[:-settings.PROFILING_MAX_REPORTS]:
+        for path in directory.glob(f"{report_id}.*"):
+            path.unlink(missing_ok=True)
+
+
+def list_reports():
+    directory = Path(settings.PROFILING_DIR)
+    if not directory.is_dir():
+        return []
+    reports = []
+    for path in sorted(directory.glob('*.json'), reverse=True):
+        if REPORT_ID.match(path.stem):
+            try:
+                meta = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue  # trimmed while we were reading
+            meta.pop('queries', None)
+            reports.append({'id': path.stem, **meta})
+    return reports
+
+
+def get_report(report_id):
+    if not REPORT_ID.match(report_id):
+        return None
+    try:
+        return {'id': report_id, **json.loads((Path(settings.PROFILING_DIR) / f"{report_id}.json").read_text())}
+    except (OSError, ValueError):
+        return None
+
+
+def artifact_path(report_id, ext):
+    if not REPORT_ID.match(report_id) or ext not in ARTIFACT_TYPES:
+        return None
+    path = Path(settings.PROFILING_DIR) / f"{report_id}.{ext}"
+    return path if path.is_file() else None
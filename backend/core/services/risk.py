@@ -0,0 +1,161 @@
+# kenya-earn/backend/core/services/risk.py
+"""
+Velocity limits for money movement, checked without touching the database.
+
+Each limited dimension (sender, recipient, device, IP) keeps two counters
+in the cache: a request count and an amount in cents, bucketed by fixed
+windows. The sliding-window value is the current bucket plus the previous
+bucket weighted by how much of it still overlaps the window. A check
+increments the current buckets and reads the (closed) previous ones,
+then compares the values the increments returned, so concurrent requests
+can't all pass on the same reading. A denied attempt takes its
+increments back.
+
+On Redis all of that is one pipelined round trip (two when denied);
+other cache backends fall back to add/incr per counter.
+
+The counters only approximate the ledger. Anything they miss is picked
+up later by flag_transfer_rings, which reads the real transfers.
+"""
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache
+
+
+class VelocityExceeded(Exception):
+    def __init__(self, dimension, limit):
+        self.dimension = dimension
+        self.limit = limit
+        super().__init__(f"{dimension} {limit} limit exceeded")
+
+
+def client_ip(request):
+    """
+    The client address as seen by our proxies, or None if that can't be
+    trusted. Behind RISK_TRUSTED_PROXY_HOPS proxies that each append to
+    X-Forwarded-For, the client is that many entries from the right;
+    anything further left is whatever the client chose to send.
+    """
+    hops = settings.RISK_TRUSTED_PROXY_HOPS
+    if not hops:
+        # REMOTE_ADDR would be the proxy, shared by every user
+        return None
+    forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+    if len(forwarded) < hops:
+        return None
+    return forwarded[-hops]
+
+
+def _subjects(request, profile, recipient):
+    yield 'sender', profile.pk
+    if recipient is not None:
+        yield 'recipient', recipient.pk
+    device = request.headers.get('X-Device-Id')
+    if device:
+        yield 'device', device[:64]
+    ip = client_ip(request)
+    if ip:
+        yield 'ip', ip
+
+
+def _keys(action, dimension, subject, window, now):
+    bucket = int(now // window)
+    base = f"risk:{action}:{dimension}:{subject}:{window}"
+    return (
+        f"{base}:{bucket}:n", f"{base}:{bucket}:a",
+        f"{base}:{bucket - 1}:n", f"{base}:{bucket - 1}:a",
+    )
+
+
+def _redis_client():
+    """The raw redis-py client behind the default cache, or None if it isn't Redis."""
+    backend = caches['default']
+    if not isinstance(backend, RedisCache):
+        return None
+    return backend._cache.get_client(write=True)
+
+
+def _incr(key, delta, timeout):
+    """Add delta to a counter, creating it if needed, and return the new value."""
+    # add() is a no-op when the key exists, so concurrent first hits can't reset each other
+    cache.add(key, 0, timeout)
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # Expired between add() and incr()
+        if cache.add(key, delta, timeout):
+            return delta
+        return cache.incr(key, delta)
+
+
+def _count(increments, read_keys):
+    """
+    Apply (key, delta, timeout) increments and read read_keys. Returns the
+    new counter values, in order, and {key: value} for the keys read.
+    """
+    client = _redis_client()
+    if client is None:
+        return [_incr(key, delta, timeout) for key, delta, timeout in increments], cache.get_many(read_keys)
+
+    pipe = client.pipeline(transaction=False)
+    for key, delta, timeout in increments:
+        key = cache.make_and_validate_key(key)
+        # Counters are stored as plain integers, as RedisCache does for ints
+        pipe.set(key, 0, ex=timeout, nx=True)
+        pipe.incrby(key, delta)
+    pipe.mget([cache.make_and_validate_key(key) for key in read_keys])
+    results = pipe.execute()
+    values = [int(v) for v in results[1:-1:2]]
+    return values, {key: int(v) for key, v in zip(read_keys, results[-1]) if v is not None}
+
+
+def _undo(increments):
+    client = _redis_client()
+    if client is not None:
+        pipe = client.pipeline(transaction=False)
+        for key, delta, _ in increments:
+            pipe.decrby(cache.make_and_validate_key(key), delta)
+        pipe.execute()
+        return
+    for key, delta, _ in increments:
+        try:
+            cache.decr(key, delta)
+        except ValueError:
+            pass  # already expired
+
+
+def check(action, request, profile, amount, recipient=None):
+    """
+    Count this attempt against every limit in RISK_LIMITS[action], or raise
+    VelocityExceeded (without counting it) if it would go over one.
+    """
+    limits = settings.RISK_LIMITS.get(action)
+    if not limits:
+        return
+
+    now = time.time()
+    cents = int(Decimal(amount) * 100)
+    plan = []
+    for dimension, subject in _subjects(request, profile, recipient):
+        limit = limits.get(dimension)
+        if limit:
+            plan.append((dimension, limit, _keys(action, dimension, subject, limit['window'], now)))
+
+    increments = []
+    for _, limit, (count_key, amount_key, _, _) in plan:
+        increments += [(count_key, 1, limit['window'] * 2), (amount_key, cents, limit['window'] * 2)]
+    values, previous = _count(increments, [key for _, _, keys in plan for key in keys[2:]])
+
+    for i, (dimension, limit, (_, _, prev_count_key, prev_amount_key)) in enumerate(plan):
+        window = limit['window']
+        overlap = 1 - (now % window) / window
+        count, total = values[2 * i], values[2 * i + 1]
+        if 'count' in limit and count + previous.get(prev_count_key, 0) * overlap > limit['count']:
+            _undo(increments)
+            raise VelocityExceeded(dimension, 'count')
+        if 'amount' in limit and total + previous.get(prev_amount_key, 0) * overlap > limit['amount'] * 100:
+            _undo(increments)
+            raise VelocityExceeded(dimension, 'amount')
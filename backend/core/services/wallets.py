@@ -0,0 +1,193 @@
+# kenya-earn/backend/core/services/wallets.py
+"""
+Balance changes for wallets.
+
+A wallet flagged is_sharded keeps part of its balance on WalletShard rows.
+Credits land on one of its shard_count shards picked at random, so concurrent credits to a hot
+wallet don't queue on a single row lock. Debits lock the wallet row and then
+every shard in index order, and fold the shards back into Wallet.balance.
+
+Lock order, to keep concurrent transfers deadlock-free: wallet rows first
+(by primary key), then shard rows.
+
+The ledger a balance should agree with: completed deposits and transfers,
+plus withdrawals (debited when requested). Activation rows record the fee
+paid in through M-Pesa and never touch the wallet.
+
+Every Transaction carries balance_after, the ledger balance including that
+row. record_transaction() fills it under the wallet row lock; rows credited
+to a sharded wallet without the lock are filled by checkpoint_balances,
+which also writes the BalanceCheckpoint rows used for as-of lookups.
+Each ledger write also emits an outbox event in the same transaction.
+"""
+import random
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Q, Sum, When
+
+from core.models import BalanceCheckpoint, Transaction, Wallet, WalletShard
+from core.services import outbox
+
+LEDGER_FILTER = (
+    Q(type__in=['deposit', 'transfer'], status='completed')
+    | Q(type='withdrawal')
+)
+LEDGER_AMOUNT = Case(When(direction='debit', then=-F('amount')), default=F('amount'))
+
+
+def signed_amount(type, status, direction, amount):
+    """What one row adds to the ledger; mirrors LEDGER_FILTER and LEDGER_AMOUNT."""
+    if type != 'withdrawal' and not (type in ('deposit', 'transfer') and status == 'completed'):
+        return Decimal('0.00')
+    amount = Decimal(str(amount))
+    return -amount if direction == 'debit' else amount
+
+
+def ledger_balance(wallet, as_of=None):
+    """Ledger balance now, or at as_of: the latest checkpoint plus the rows after it."""
+    checkpoints = BalanceCheckpoint.objects.filter(wallet=wallet)
+    rows = Transaction.objects.filter(LEDGER_FILTER, wallet=wallet)
+    if as_of is not None:
+        checkpoints = checkpoints.filter(as_of__lte=as_of)
+        rows = rows.filter(timestamp__lte=as_of)
+
+    balance = Decimal('0.00')
+    checkpoint = checkpoints.order_by('-last_transaction_id').first()
+    if checkpoint is not None:
+        balance = checkpoint.balance
+        rows = rows.filter(id__gt=checkpoint.last_transaction_id)
+    return balance + (rows.aggregate(total=Sum(LEDGER_AMOUNT))['total'] or 0)
+
+
+def record_transaction(wallet, **fields):
+    """
+    Append a Transaction with its running balance. Locks the wallet row
+    (a no-op if the caller already holds it); sharded wallets are left
+    unlocked and their balance_after is filled in later.
+    """
+    tx = Transaction(wallet=wallet, **fields)
+    with transaction.atomic():
+        if not wallet.is_sharded:
+            _lock_wallets(wallet)
+            previous = (
+                Transaction.objects.filter(wallet=wallet)
+                .order_by('-id').values_list('balance_after', flat=True).first()
+            )
+            if previous is None:
+                previous = ledger_balance(wallet)
+            tx.balance_after = previous + signed_amount(tx.type, tx.status, tx.direction, tx.amount)
+        tx.save()
+        outbox.emit('transaction', 'transaction.created', tx.id, outbox.transaction_payload(tx))
+    return tx
+
+
+def complete_pending_deposit(tx):
+    """Complete a pending deposit, credit its wallet and keep running balances right."""
+    amount = Decimal(str(tx.amount))
+    with transaction.atomic():
+        if tx.wallet.is_sharded:
+            # No wallet row lock, as in record_transaction(). Crediting first
+            # holds a shard, so checkpoint_balances waits for us, then redoes
+            # the running balances from the last checkpoint before this row.
+            credit(tx.wallet, amount)
+            tx.status = 'completed'
+            tx.save(update_fields=['status'])
+            BalanceCheckpoint.objects.filter(wallet_id=tx.wallet_id, last_transaction_id__gte=tx.id).delete()
+            outbox.emit('transaction', 'transaction.completed', tx.id, outbox.transaction_payload(tx))
+            return
+
+        wallet = _lock_wallets(tx.wallet)[tx.wallet_id]
+        tx.status = 'completed'
+        tx.save(update_fields=['status'])
+        # Every row from this one on now includes the deposit
+        Transaction.objects.filter(wallet=wallet, id__gte=tx.id, balance_after__isnull=False).update(
+            balance_after=F('balance_after') + amount
+        )
+        BalanceCheckpoint.objects.filter(wallet=wallet, last_transaction_id__gte=tx.id).delete()
+        credit(wallet, amount)
+        outbox.emit('transaction', 'transaction.completed', tx.id, outbox.transaction_payload(tx))
+
+
+def get_balance(wallet):
+    if not wallet.is_sharded:
+        return wallet.balance
+    shards = wallet.shards.aggregate(total=Sum('balance'))['total'] or Decimal('0')
+    return wallet.balance + shards
+
+
+def enable_sharding(wallet, shard_count=None):
+    """Flag a hot wallet and create its (empty) shard rows."""
+    shard_count = shard_count or settings.WALLET_SHARD_COUNT
+    with transaction.atomic():
+        WalletShard.objects.bulk_create(
+            [WalletShard(wallet=wallet, index=i) for i in range(shard_count)],
+            ignore_conflicts=True,
+        )
+        # Re-sharding with fewer shards keeps the existing ones in use
+        shard_count = WalletShard.objects.filter(wallet=wallet).count()
+        Wallet.objects.filter(pk=wallet.pk).update(is_sharded=True, shard_count=shard_count)
+    wallet.is_sharded = True
+    wallet.shard_count = shard_count
+
+
+def credit(wallet, amount):
+    """Add to a wallet without reading its balance first."""
+    if wallet.is_sharded and wallet.shard_count:
+        updated = WalletShard.objects.filter(
+            wallet=wallet, index=random.randrange(wallet.shard_count)
+        ).update(balance=F('balance') + amount)
+        if updated:
+            return
+        # Stale wallet object; the wallet row still counts
+    Wallet.objects.filter(pk=wallet.pk).update(balance=F('balance') + amount)
+
+
+def _lock_wallets(*wallets):
+    ids = sorted({w.pk for w in wallets})
+    return {w.pk: w for w in Wallet.objects.select_for_update().filter(pk__in=ids).order_by('pk')}
+
+
+def _debit_locked(wallet, amount):
+    """Debit a wallet whose row is already locked. Returns False if funds are short."""
+    if not wallet.is_sharded:
+        if wallet.balance < amount:
+            return False
+        Wallet.objects.filter(pk=wallet.pk).update(balance=F('balance') - amount)
+        return True
+
+    # Consolidate: lock every shard in order, move it all onto the wallet row
+    shards = list(WalletShard.objects.select_for_update().filter(wallet=wallet).order_by('index'))
+    total = wallet.balance + sum((s.balance for s in shards), Decimal('0'))
+    if total < amount:
+        return False
+    WalletShard.objects.filter(pk__in=[s.pk for s in shards]).update(balance=0)
+    Wallet.objects.filter(pk=wallet.pk).update(balance=total - amount)
+    return True
+
+
+def debit(wallet, amount):
+    with transaction.atomic():
+        locked = _lock_wallets(wallet)
+        return _debit_locked(locked[wallet.pk], amount)
+
+
+def transfer(sender_wallet, recipient_wallet, amount):
+    """
+    Move money between wallets. Must run inside transaction.atomic().
+    Returns False (and changes nothing) if the sender can't cover it.
+    """
+    # A sharded recipient is credited on a shard, so its wallet row isn't
+    # needed, unless the sender is sharded too: then its shard locks would
+    # come before the recipient's shard, and two opposite transfers could
+    # deadlock. Locking both wallet rows (by pk) first serialises them.
+    if recipient_wallet.is_sharded and not sender_wallet.is_sharded:
+        to_lock = [sender_wallet]
+    else:
+        to_lock = [sender_wallet, recipient_wallet]
+    locked = _lock_wallets(*to_lock)
+    if not _debit_locked(locked[sender_wallet.pk], amount):
+        return False
+    credit(recipient_wallet, amount)
+    return True
@@ -0,0 +1,13 @@
+# kenya-earn/backend/core/signals.py
+"""Model signal receivers, connected in CoreConfig.ready()."""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import Task
+from core.services import feed
+
+
+@receiver([post_save, post_delete], sender=Task)
+def task_changed(sender, instance, **kwargs):
+    # Every save path (admin, views, shell, imports), not just the ones we remember
+    feed.invalidate()
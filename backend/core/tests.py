@@ -1,3 +1,860 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+
+from kenya_earn import auth_policy, middleware
+
+from . import views
+from .admin import TaskAdmin
+from .management.commands.reconcile_wallets import Command as ReconcileWallets
+from .models import (
+    AccountPurge, DailyRollup, DeviceToken, IdempotencyKey, Notification, OutboxEvent, Payment, Profile,
+    Task, Transaction, Wallet,
+)
+from .services import accounts, analytics, feed, health, notifications, outbox, paystack, profiling, risk, wallets
+
+
+def firebase_user(token):
+    # Tests authenticate with "Bearer <uid>"
+    return {'uid': token}
+
+
+class APITestCase(TestCase):
+    def setUp(self):
+        patcher = mock.patch('firebase_admin.auth.verify_id_token', firebase_user)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+
+    def make_user(self, uid, balance=0, **fields):
+        profile = Profile.objects.create(firebase_uid=uid, is_activated=True, **fields)
+        Wallet.objects.create(profile=profile, balance=balance)
+        return profile
+
+    def post(self, path, data, uid, **headers):
+        return self.client.post(
+            path, data=json.dumps(data), content_type='application/json',
+            HTTP_AUTHORIZATION=f'Bearer {uid}', **headers,
+        )
+
+
+TRANSFER_LIMITS = {
+    'transfer': {
+        'sender': {'count': 3, 'window': 3600},
+        'ip': {'count': 60, 'window': 3600},
+    },
+}
+
+
+@override_settings(RISK_LIMITS=TRANSFER_LIMITS, RISK_TRUSTED_PROXY_HOPS=0)
+class VelocityCheckTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def request(self, **meta):
+        return self.factory.post('/', REMOTE_ADDR='10.0.0.1', **meta)
+
+    def test_ip_limit_skipped_when_proxies_are_not_trusted(self):
+        # Every request arrives from the proxy's address
+        for i in range(70):
+            risk.check('transfer', self.request(), Profile(pk=i + 1), '1.00')
+
+    @override_settings(RISK_TRUSTED_PROXY_HOPS=1)
+    def test_client_ip_is_the_hop_our_proxy_appended(self):
+        request = self.request(HTTP_X_FORWARDED_FOR='6.6.6.6, 41.90.1.2')
+        self.assertEqual(risk.client_ip(request), '41.90.1.2')
+        self.assertIsNone(risk.client_ip(self.request()))
+
+    def test_denied_attempt_is_not_counted(self):
+        sender = Profile(pk=1)
+        for _ in range(3):
+            risk.check('transfer', self.request(), sender, '1.00')
+        with self.assertRaises(risk.VelocityExceeded):
+            risk.check('transfer', self.request(), sender, '1.00')
+        with override_settings(RISK_LIMITS={'transfer': {'sender': {'count': 4, 'window': 3600}}}):
+            risk.check('transfer', self.request(), sender, '1.00')
+
+    def test_concurrent_checks_cannot_overshoot(self):
+        passed = []
+
+        def attempt():
+            try:
+                risk.check('transfer', self.request(), Profile(pk=1), '1.00')
+                passed.append(1)
+            except risk.VelocityExceeded:
+                pass
+
+        threads = [threading.Thread(target=attempt) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(passed), 3)
+
+
+
+class FakeRedis:
+    """Just enough of a redis-py client for risk's pipelines; counts round trips."""
+
+    def __init__(self):
+        self.data = {}
+        self.round_trips = 0
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def set(self, key, value, ex=None, nx=False):
+        self.commands.append(lambda data: None if nx and key in data else data.__setitem__(key, value))
+
+    def incrby(self, key, delta):
+        self.commands.append(lambda data: data.__setitem__(key, data.get(key, 0) + delta) or data[key])
+
+    def decrby(self, key, delta):
+        self.incrby(key, -delta)
+
+    def mget(self, keys):
+        self.commands.append(lambda data: [data.get(key) for key in keys])
+
+    def execute(self):
+        self.redis.round_trips += 1
+        return [command(self.redis.data) for command in self.commands]
+
+
+@override_settings(RISK_LIMITS=TRANSFER_LIMITS, RISK_TRUSTED_PROXY_HOPS=1)
+class PipelinedVelocityCheckTests(TestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        patcher = mock.patch.object(risk, '_redis_client', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_one_round_trip_per_check_and_one_more_to_undo(self):
+        request = RequestFactory().post('/', HTTP_X_FORWARDED_FOR='41.90.1.2', HTTP_X_DEVICE_ID='phone')
+        for _ in range(3):
+            risk.check('transfer', request, Profile(pk=1), '1.00', recipient=Profile(pk=2))
+        self.assertEqual(self.redis.round_trips, 3)
+
+        with self.assertRaises(risk.VelocityExceeded):
+            risk.check('transfer', request, Profile(pk=1), '1.00', recipient=Profile(pk=2))
+        self.assertEqual(self.redis.round_trips, 5)
+        # The denied attempt left every counter where it was
+        self.assertEqual(set(self.redis.data.values()), {3, 300})
+
+@override_settings(RISK_LIMITS=TRANSFER_LIMITS)
+class VelocityResponseTests(APITestCase):
+    def test_rate_limited_response_is_not_replayed(self):
+        self.make_user('sender', balance=100)
+        recipient = self.make_user('recipient')
+        body = {'recipient_code': recipient.referral_code, 'amount': 1}
+        for _ in range(3):
+            self.assertEqual(self.post('/api/wallet/transfer/', body, 'sender').status_code, 200)
+
+        response = self.post('/api/wallet/transfer/', body, 'sender', HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(response.status_code, 429)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        with override_settings(RISK_LIMITS={}):
+            response = self.post('/api/wallet/transfer/', body, 'sender', HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(response.status_code, 200)
+
+
+class FlakySender:
+    """Fails every push in the given batch numbers (1-based) as retriable."""
+
+    def __init__(self, failing_batches=()):
+        self.failing_batches = set(failing_batches)
+        self.calls = []
+
+    def send(self, pushes):
+        self.calls.append([p.token for p in pushes])
+        if len(self.calls) in self.failing_batches:
+            return [notifications.RETRIABLE] * len(pushes)
+        return [None] * len(pushes)
+
+
+class NotificationWorkerTests(TestCase):
+    def broadcast_to(self, devices):
+        for i in range(devices):
+            profile = Profile.objects.create(firebase_uid=f'u{i}', is_activated=True)
+            DeviceToken.objects.create(profile=profile, token=f't{i:05d}')
+        return notifications.notify(None, 'task.published', 'New task', 'Survey')
+
+    def test_firebase_errors_are_classified_by_type(self):
+        from firebase_admin import exceptions, messaging
+
+        classify = notifications.FirebaseSender.classify
+        self.assertEqual(classify(messaging.UnregisteredError('gone')), notifications.DEAD_TOKEN)
+        self.assertEqual(classify(messaging.SenderIdMismatchError('other app')), notifications.DEAD_TOKEN)
+        self.assertEqual(classify(messaging.QuotaExceededError('slow down')), notifications.RETRIABLE)
+        self.assertEqual(classify(exceptions.UnavailableError('down')), notifications.RETRIABLE)
+        self.assertEqual(classify(exceptions.InvalidArgumentError('bad payload')), notifications.FAILED)
+
+    def test_partial_broadcast_retries_only_the_failed_devices(self):
+        notification = self.broadcast_to(notifications.MAX_BATCH + 10)
+        sender = FlakySender(failing_batches=[2])
+        notifications.send_due(sender, concurrency=1)
+
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, 'pending')
+        self.assertEqual(notification.retry_tokens, sender.calls[1])
+
+        Notification.objects.update(next_attempt_at=notification.created_at)
+        retry = FlakySender()
+        notifications.send_due(retry, concurrency=1)
+        self.assertEqual(retry.calls, [sender.calls[1]])
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, 'sent')
+
+    def test_lease_is_renewed_after_each_batch(self):
+        self.broadcast_to(notifications.MAX_BATCH * 2 + 1)
+        with CaptureQueriesContext(connection) as queries:
+            notifications.send_due(FlakySender(), concurrency=1)
+        lease_updates = [
+            q['sql'] for q in queries.captured_queries
+            if q['sql'].startswith('UPDATE') and '"next_attempt_at"' in q['sql'] and '"status"' not in q['sql']
+        ]
+        # One for the claim, one after each of the three batches
+        self.assertEqual(len(lease_updates), 4)
+
+
+class ReconcileWalletsTests(TestCase):
+    def wallet_with_ledger(self, balance, ledger):
+        profile = Profile.objects.create(firebase_uid=f'w{balance}-{ledger}')
+        wallet = Wallet.objects.create(profile=profile, balance=balance)
+        Transaction.objects.create(wallet=wallet, amount=ledger, type='deposit', status='completed')
+        return wallet
+
+    def test_fix_rechecks_before_correcting(self):
+        # Reported as drifted by the scan, but the transfer has landed since
+        settled = self.wallet_with_ledger(100, 100)
+        drifted = self.wallet_with_ledger(90, 100)
+        stale = [(settled.id, Decimal('90.00'), Decimal('100.00')), (drifted.id, Decimal('90.00'), Decimal('100.00'))]
+
+        self.assertEqual(ReconcileWallets()._fix(stale), 1)
+        settled.refresh_from_db()
+        drifted.refresh_from_db()
+        self.assertEqual(settled.balance, Decimal('100.00'))
+        self.assertEqual(drifted.balance, Decimal('100.00'))
+
+
+class IdempotencyTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.sender = self.make_user('sender', balance=100)
+        recipient = self.make_user('recipient')
+        self.body = {'recipient_code': recipient.referral_code, 'amount': 10}
+
+    def transfer(self, key='k1', body=None):
+        return self.post('/api/wallet/transfer/', body or self.body, 'sender', HTTP_IDEMPOTENCY_KEY=key)
+
+    def balance(self):
+        return Wallet.objects.get(profile=self.sender).balance
+
+    def test_retry_replays_the_stored_response(self):
+        first = self.transfer()
+        second = self.transfer()
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.balance(), Decimal('90.00'))
+
+    def test_key_reused_for_a_different_request(self):
+        self.transfer()
+        response = self.transfer(body={**self.body, 'amount': 20})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.balance(), Decimal('90.00'))
+
+    def test_in_flight_key_is_not_run_again(self):
+        IdempotencyKey.objects.create(firebase_uid='sender', key='k1', request_hash=self._hash())
+        # Another worker holds the row lock while it runs the view
+        with mock.patch('core.idempotency._lock', side_effect=DatabaseError('lock not available')):
+            response = self.transfer()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.balance(), Decimal('100.00'))
+
+    def test_key_left_by_a_dead_transaction_runs_once(self):
+        # In flight, but no lock held: its transaction rolled back
+        IdempotencyKey.objects.create(firebase_uid='sender', key='k1', request_hash=self._hash())
+        self.assertEqual(self.transfer().status_code, 200)
+        self.assertEqual(self.transfer()['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.balance(), Decimal('90.00'))
+
+    def test_view_writes_and_stored_response_commit_together(self):
+        with mock.patch('core.services.wallets.record_transaction', side_effect=RuntimeError('crash')):
+            with self.assertRaises(RuntimeError):
+                self.transfer()
+        self.assertEqual(self.balance(), Decimal('100.00'))
+        self.assertEqual(self.transfer().status_code, 200)
+        self.assertEqual(self.balance(), Decimal('90.00'))
+
+    def _hash(self):
+        return hashlib.sha256(b'/api/wallet/transfer/\n' + json.dumps(self.body).encode()).hexdigest()
+
+
+class OutboxStreamTests(TestCase):
+    def test_torn_last_line_is_dropped_on_recovery(self):
+        with tempfile.TemporaryDirectory() as directory:
+            sink = outbox.SegmentedFileSink(directory)
+            sink.publish([{'n': 0}, {'n': 1}])
+            with open(sink._path(0), 'a') as f:
+                f.write('{"n": 2, "off')  # crash mid-write
+
+            sink = outbox.SegmentedFileSink(directory)
+            self.assertEqual(sink.next_offset, 2)
+            sink.publish([{'n': 2}])
+            records = outbox.SegmentedFileReader(directory).read(0)
+            self.assertEqual([(r['offset'], r['n']) for r in records], [(0, 0), (1, 1), (2, 2)])
+
+    @override_settings(OUTBOX_SINK='core.services.outbox.QueueSink', OUTBOX_SINK_OPTIONS={})
+    def test_follow_mode_prunes_published_events(self):
+        old = timezone.now() - timedelta(days=30)
+        OutboxEvent.objects.create(topic='task', event_type='task.approved', aggregate_id=1, payload={}, published_at=old)
+        # Stop the otherwise endless loop at its first idle poll
+        with mock.patch('time.sleep', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('relay_outbox', follow=True, stdout=io.StringIO())
+        self.assertFalse(OutboxEvent.objects.exists())
+
+
+    def test_tail_changes_reads_the_configured_sink(self):
+        with tempfile.TemporaryDirectory() as directory:
+            outbox.SegmentedFileSink(directory).publish([{'topic': 'task', 'n': 0}, {'topic': 'payment', 'n': 1}])
+            out = io.StringIO()
+            with override_settings(OUTBOX_SINK='core.services.outbox.SegmentedFileSink',
+                                   OUTBOX_SINK_OPTIONS={'directory': directory}):
+                call_command('tail_changes', 'audit', topic=['payment'], stdout=out)
+        self.assertEqual([json.loads(line)['n'] for line in out.getvalue().splitlines()], [1])
+        self.assertEqual(outbox.get_offset('audit'), 2)
+
+    @override_settings(OUTBOX_SINK='core.services.outbox.QueueSink', OUTBOX_SINK_OPTIONS={})
+    def test_tail_changes_refuses_an_in_process_sink(self):
+        with self.assertRaisesMessage(CommandError, "QueueSink can't be read back"):
+            call_command('tail_changes', 'audit', stdout=io.StringIO())
+
+    def test_sink_options_follow_the_configured_sink(self):
+        env = {**os.environ, 'OUTBOX_SINK': 'core.services.outbox.QueueSink', 'DJANGO_SETTINGS_MODULE': 'kenya_earn.settings'}
+        env.pop('OUTBOX_SINK_OPTIONS', None)
+        script = 'import django; django.setup(); from core.services import outbox; print(type(outbox.get_sink()).__name__)'
+        result = subprocess.run([sys.executable, '-c', script], env=env, cwd=settings.BASE_DIR, capture_output=True, text=True)
+        self.assertEqual(result.stdout.strip(), 'QueueSink', result.stderr)
+
+        env['OUTBOX_SINK_OPTIONS'] = '{"maxsize": 5}'
+        script = 'import django; django.setup(); from core.services import outbox; print(outbox.get_sink().queue.maxsize)'
+        result = subprocess.run([sys.executable, '-c', script], env=env, cwd=settings.BASE_DIR, capture_output=True, text=True)
+        self.assertEqual(result.stdout.strip(), '5', result.stderr)
+
+class CheckpointBalancesTests(TestCase):
+    def wallet(self, uid):
+        return Wallet.objects.create(profile=Profile.objects.create(firebase_uid=uid))
+
+    def deposit(self, wallet, amount, status='completed'):
+        return Transaction.objects.create(wallet=wallet, amount=amount, type='deposit', status=status)
+
+    def test_wallet_behind_a_newer_checkpoint_is_still_checkpointed(self):
+        early, late = self.wallet('early'), self.wallet('late')
+        pending = self.deposit(early, 5, status='pending')
+        self.deposit(late, 10)
+        call_command('checkpoint_balances', stdout=io.StringIO())
+
+        # Completing the deposit drops early's checkpoint; late's is still newer
+        wallets.complete_pending_deposit(pending)
+        self.assertFalse(early.checkpoints.exists())
+        call_command('checkpoint_balances', stdout=io.StringIO())
+
+        checkpoint = early.checkpoints.get()
+        self.assertEqual(checkpoint.balance, Decimal('5.00'))
+        self.assertEqual(checkpoint.last_transaction_id, pending.id)
+        self.assertEqual(late.checkpoints.count(), 1)
+
+
+    def test_sharded_deposit_completes_without_the_wallet_lock(self):
+        wallet = self.wallet('promoter')
+        wallets.enable_sharding(wallet, shard_count=2)
+        pending = self.deposit(wallet, 50, status='pending')
+        self.deposit(wallet, 10)
+        call_command('checkpoint_balances', stdout=io.StringIO())
+
+        with CaptureQueriesContext(connection) as queries:
+            wallets.complete_pending_deposit(pending)
+        self.assertFalse([q for q in queries.captured_queries if 'FROM "core_wallet"' in q['sql']])
+        self.assertFalse(wallet.checkpoints.exists())
+        self.assertEqual(wallet.shards.aggregate(total=Sum('balance'))['total'], Decimal('50.00'))
+
+        call_command('checkpoint_balances', stdout=io.StringIO())
+        self.assertEqual(
+            list(wallet.transactions.order_by('id').values_list('balance_after', flat=True)),
+            [Decimal('50.00'), Decimal('60.00')],
+        )
+
+class RollupTests(TestCase):
+    def test_late_activation_is_counted_on_the_day_it_happened(self):
+        signed_up = timezone.now() - timedelta(days=5)
+        referrer = Profile.objects.create(firebase_uid='referrer', is_activated=True)
+        Wallet.objects.create(profile=referrer)
+        referred = Profile.objects.create(firebase_uid='referred', referred_by=referrer, city='Nairobi', created_at=signed_up)
+        Wallet.objects.create(profile=referred)
+        Payment.objects.create(
+            profile=referred, mpesa_checkout_id='ref-1', amount=300, phone_number='254700000000', created_at=signed_up,
+        )
+        analytics.refresh_rollups()
+
+        # Paid days later, well outside the lookback from the signup day
+        paystack.complete_activation('ref-1', 300)
+        analytics.refresh_rollups()
+
+        signup_day = DailyRollup.objects.get(day=timezone.localdate(signed_up), city='Nairobi')
+        today = DailyRollup.objects.get(day=timezone.localdate(), city='Nairobi')
+        self.assertEqual((signup_day.signups, signup_day.referred_activations, signup_day.activations), (1, 0, 0))
+        self.assertEqual((today.referred_activations, today.activations, today.revenue), (1, 1, Decimal('300.00')))
+
+
+class ShardedWalletTests(TestCase):
+    def setUp(self):
+        self.plain = Wallet.objects.create(profile=Profile.objects.create(firebase_uid='plain'))
+        self.wallet = Wallet.objects.create(profile=Profile.objects.create(firebase_uid='hot'), balance=10)
+        wallets.enable_sharding(self.wallet, shard_count=4)
+
+    def shard_balances(self):
+        return list(self.wallet.shards.order_by('index').values_list('balance', flat=True))
+
+    @override_settings(WALLET_SHARD_COUNT=64)
+    def test_credit_lands_on_one_of_the_wallets_own_shards(self):
+        for _ in range(20):
+            wallets.credit(self.wallet, Decimal('1.00'))
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal('10.00'))
+        self.assertEqual(sum(self.shard_balances()), Decimal('20.00'))
+        self.assertEqual(wallets.get_balance(self.wallet), Decimal('30.00'))
+
+    def test_debit_consolidates_the_shards(self):
+        self.wallet.shards.update(balance=5)
+        self.assertFalse(wallets.debit(self.wallet, Decimal('31.00')))
+        self.assertTrue(wallets.debit(self.wallet, Decimal('25.00')))
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal('5.00'))
+        self.assertEqual(self.shard_balances(), [Decimal('0.00')] * 4)
+
+    def test_transfer_locks_wallet_rows_by_pk_then_shards(self):
+        # Sharded sender, so the debit has shards to lock; the recipient has the lower pk
+        with CaptureQueriesContext(connection) as queries, transaction.atomic():
+            self.assertTrue(wallets.transfer(self.wallet, self.plain, Decimal('5.00')))
+
+        selects = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('SELECT')]
+        self.assertIn('FROM "core_wallet"', selects[0])
+        self.assertIn('ORDER BY "core_wallet"."id" ASC', selects[0])
+        self.assertIn('FROM "core_walletshard"', selects[1])
+        self.assertIn('ORDER BY "core_walletshard"."index" ASC', selects[1])
+
+
+    def test_transfer_between_sharded_wallets_locks_both_wallet_rows_first(self):
+        other = Wallet.objects.create(profile=Profile.objects.create(firebase_uid='hot2'))
+        wallets.enable_sharding(other, shard_count=2)
+        with CaptureQueriesContext(connection) as queries, transaction.atomic():
+            self.assertTrue(wallets.transfer(other, self.wallet, Decimal('0.00')))
+
+        selects = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('SELECT')]
+        self.assertIn('FROM "core_wallet"', selects[0])
+        self.assertIn(f'IN ({self.wallet.pk}, {other.pk})', selects[0])
+        self.assertIn('FROM "core_walletshard"', selects[1])
+
+class AccountDeletionTests(TestCase):
+    def setUp(self):
+        self.profile = Profile.objects.create(firebase_uid='leaving', first_name='Wanjiru')
+        wallet = Wallet.objects.create(profile=self.profile, balance=20)
+        Transaction.objects.create(wallet=wallet, amount=20, type='deposit')
+        self.payment = Payment.objects.create(
+            profile=self.profile, mpesa_checkout_id='ref-1', amount=300, phone_number='254700000000',
+        )
+
+    def test_late_payment_does_not_activate_a_deleted_account(self):
+        accounts.tombstone(self.profile)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'failed')
+        self.assertTrue(OutboxEvent.objects.filter(event_type='payment.failed', aggregate_id=self.payment.id).exists())
+
+        self.assertTrue(paystack.complete_activation('ref-1', 300))
+        self.profile.refresh_from_db()
+        self.assertFalse(self.profile.is_activated)
+        self.assertFalse(Transaction.objects.filter(type='activation').exists())
+
+    def test_purge_removes_every_row_in_batches(self):
+        accounts.tombstone(self.profile)
+        record = AccountPurge.objects.get(profile_id=self.profile.pk)
+        self.assertTrue(accounts.purge(record, batch_size=1))
+        record.refresh_from_db()
+        self.assertEqual((record.stage, record.rows_purged), ('done', 4))
+        self.assertFalse(Profile.objects.filter(pk=self.profile.pk).exists())
+        self.assertFalse(Payment.objects.exists())
+
+
+class ResponseCompressionTests(TestCase):
+    def encoding_for(self, accept_encoding, content_type='application/json'):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        body = b'{"tasks": []}' * 200
+        compress = middleware.ResponseCompressionMiddleware(lambda request: HttpResponse(body, content_type=content_type))
+        return compress(request).get('Content-Encoding')
+
+    def gzipped(self):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        compress = middleware.ResponseCompressionMiddleware(
+            lambda request: HttpResponse(b'{"tasks": []}' * 200, content_type='application/json')
+        )
+        return compress(request).content
+
+    @unittest.skipIf(middleware.brotli is None, 'brotli is not installed')
+    def test_encoding_follows_q_values(self):
+        self.assertEqual(self.encoding_for('gzip, deflate, br'), 'br')
+        self.assertEqual(self.encoding_for('gzip, br;q=0'), 'gzip')
+        self.assertEqual(self.encoding_for('br;q=0.5, gzip'), 'gzip')
+        self.assertEqual(self.encoding_for('*'), 'br')
+        self.assertEqual(self.encoding_for('*, br;q=0'), 'gzip')
+
+    def test_only_json_is_compressed(self):
+        self.assertEqual(self.encoding_for('gzip', 'application/json; charset=utf-8'), 'gzip')
+        self.assertIsNone(self.encoding_for('gzip, br', 'text/html; charset=utf-8'))
+
+    def test_gzip_output_is_padded(self):
+        sizes = {len(self.gzipped()) for _ in range(20)}
+        self.assertGreater(len(sizes), 1)
+
+    def test_nothing_acceptable_is_left_alone(self):
+        self.assertIsNone(self.encoding_for('gzip;q=0, br;q=0'))
+        self.assertIsNone(self.encoding_for('identity'))
+        self.assertIsNone(self.encoding_for('brotli-ish, xgzip'))
+
+
+class ReconcilePaymentsTests(TestCase):
+    def test_one_mpesa_token_per_run(self):
+        profile = Profile.objects.create(firebase_uid='payer')
+        for i in range(3):
+            Payment.objects.create(
+                profile=profile, mpesa_checkout_id=f'ws_CO_{i}', amount=300, phone_number='254700000000',
+                created_at=timezone.now() - timedelta(hours=1),
+            )
+        with mock.patch('core.services.mpesa.get_mpesa_access_token', return_value='token') as get_token, \
+                mock.patch('core.services.mpesa.stk_push_query', return_value={'ResultCode': '1032'}) as query:
+            call_command('reconcile_payments', stdout=io.StringIO())
+
+        get_token.assert_called_once_with()
+        self.assertEqual(query.call_count, 3)
+        self.assertEqual({call.kwargs['access_token'] for call in query.call_args_list}, {'token'})
+        self.assertEqual(set(Payment.objects.values_list('status', flat=True)), {'failed'})
+
+
+@mock.patch('firebase_admin.get_app')
+class FirebaseHealthTests(TestCase):
+    def set_expiry(self, seconds_from_now):
+        patcher = mock.patch.object(health, '_certs_expire_at', time.time() + seconds_from_now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def refreshing(self):
+        # Another probe is mid-refresh
+        health._refresh_lock.acquire()
+        self.addCleanup(health._refresh_lock.release)
+
+    def test_probes_during_a_refresh_use_the_current_certs(self, get_app):
+        self.set_expiry(60)
+        self.refreshing()
+        self.assertIsNone(health.check_firebase())
+
+    def test_probes_fail_once_the_certs_have_expired(self, get_app):
+        self.set_expiry(-1)
+        self.refreshing()
+        self.assertIn('expired', health.check_firebase())
+
+    def test_failed_early_refresh_keeps_serving_valid_certs(self, get_app):
+        self.set_expiry(60)
+        with mock.patch('requests.get', side_effect=requests.ConnectionError('offline')) as get:
+            self.assertIsNone(health.check_firebase())
+        get.assert_called_once()
+
+        self.set_expiry(-1)
+        with mock.patch('requests.get', side_effect=requests.ConnectionError('offline')):
+            self.assertIn('offline', health.check_firebase())
+
+
+class SparseFieldsetTests(APITestCase):
+    def test_fields_trim_the_response_and_the_select(self):
+        sender = self.make_user('sender', first_name='Achieng')
+        recipient = self.make_user('recipient')
+        Transaction.objects.create(
+            wallet=recipient.wallet, amount=5, type='transfer', recipient=sender, description='lunch',
+        )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                '/api/wallet/?fields=id,amount,recipient_name', HTTP_AUTHORIZATION='Bearer recipient',
+            )
+        self.assertEqual(response.json()['transactions'], [
+            {'id': mock.ANY, 'amount': '5.00', 'recipient_name': 'Achieng '},
+        ])
+        select = next(q['sql'] for q in queries.captured_queries if 'FROM "core_transaction"' in q['sql'])
+        self.assertIn('"core_profile"."first_name"', select)  # joined, not one query per row
+        self.assertNotIn('"core_transaction"."description"', select)
+        self.assertNotIn('"core_profile"."email"', select)
+
+    def test_exclude_drops_fields(self):
+        self.make_user('worker', city='Kisumu')
+        response = self.client.get('/api/profile/?exclude=email,address', HTTP_AUTHORIZATION='Bearer worker')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('email', response.json())
+        self.assertEqual(response.json()['city'], 'Kisumu')
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(
+            PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=0.0, PROFILING_DIR=directory.name, PROFILING_MAX_REPORTS=50,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def profiled(self, **headers):
+        def view(request):
+            Profile.objects.count()
+            return HttpResponse('{}', content_type='application/json')
+
+        return middleware.ProfilingMiddleware(view)(RequestFactory().get('/api/tasks/', **headers))
+
+    def test_only_valid_tokens_trigger_a_profile(self):
+        self.assertNotIn('X-Profile-Id', self.profiled())
+        self.assertNotIn('X-Profile-Id', self.profiled(HTTP_X_PROFILE_TOKEN='forged'))
+        expired = profiling.make_token('ops@example.com', minutes=-1)
+        self.assertNotIn('X-Profile-Id', self.profiled(HTTP_X_PROFILE_TOKEN=expired))
+
+        response = self.profiled(HTTP_X_PROFILE_TOKEN=profiling.make_token('ops@example.com'))
+        report = profiling.get_report(response['X-Profile-Id'])
+        self.assertEqual(report['trigger'], 'ops@example.com')
+        self.assertEqual(report['query_count'], 1)
+        self.assertIn('tests.py', report['queries'][0]['origin'])
+
+    def test_sampling(self):
+        with override_settings(PROFILING_SAMPLE_RATE=0.5), mock.patch('random.random', return_value=0.4):
+            response = self.profiled()
+        self.assertEqual(profiling.get_report(response['X-Profile-Id'])['trigger'], 'sampled')
+        with override_settings(PROFILING_SAMPLE_RATE=0.5), mock.patch('random.random', return_value=0.6):
+            self.assertNotIn('X-Profile-Id', self.profiled())
+
+    @override_settings(PROFILING_MAX_REPORTS=2)
+    def test_only_the_newest_reports_are_kept(self):
+        token = profiling.make_token('ops@example.com')
+        ids = [self.profiled(HTTP_X_PROFILE_TOKEN=token)['X-Profile-Id'] for _ in range(3)]
+        self.assertEqual([r['id'] for r in profiling.list_reports()], ids[:0:-1])
+        self.assertIsNone(profiling.get_report(ids[0]))
+        self.assertEqual(list(Path(settings.PROFILING_DIR).glob(f'{ids[0]}.*')), [])
+
+    def test_admin_list_and_download(self):
+        report_id = self.profiled(HTTP_X_PROFILE_TOKEN=profiling.make_token('ops@example.com'))['X-Profile-Id']
+        ext = profiling.get_report(report_id)['artifacts'][0]
+
+        self.assertEqual(self.client.get('/admin/profiling/').status_code, 302)  # to the admin login
+        self.client.force_login(User.objects.create_user('ops', is_staff=True))
+        listing = self.client.get('/admin/profiling/')
+        self.assertContains(listing, report_id)
+        self.assertContains(listing, 'GET /api/tasks/')
+        download = self.client.get(f'/admin/profiling/{report_id}/{ext}')
+        self.assertEqual(download['Content-Type'], profiling.ARTIFACT_TYPES[ext])
+        self.assertTrue(b''.join(download.streaming_content))
+        self.assertEqual(self.client.get(f'/admin/profiling/{report_id}/exe').status_code, 404)
+        self.assertEqual(self.client.get('/admin/profiling/../secrets/txt').status_code, 404)
+
+    def test_cprofile_fallback_without_pyinstrument(self):
+        with mock.patch.object(profiling, 'Profiler', None):
+            response = self.profiled(HTTP_X_PROFILE_TOKEN=profiling.make_token('ops@example.com'))
+        report = profiling.get_report(response['X-Profile-Id'])
+        self.assertEqual((report['profiler'], report['artifacts']), ('cProfile', ['txt', 'prof']))
+        self.assertIsNotNone(profiling.artifact_path(report['id'], 'prof'))
+
+
+class TaskFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def worker(self, uid, city, device=True):
+        profile = Profile.objects.create(firebase_uid=uid, city=city, is_activated=True, activated_at=timezone.now())
+        if device:
+            DeviceToken.objects.create(profile=profile, token=f'token-{uid}')
+        return profile
+
+    def task(self, title, **targeting):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Task.objects.create(
+                title=title, description='', reward_amount=10, posted_by='admin',
+                expires_at=timezone.now() + timedelta(days=1), **targeting,
+            )
+
+    def feed_titles(self, profile):
+        return [task.title for task in feed.tasks_for(profile)]
+
+    def test_tasks_saved_through_the_orm_show_up_in_cached_feeds(self):
+        nairobi, mombasa = self.worker('n', 'Nairobi'), self.worker('m', ' mombasa ')
+        self.assertEqual(self.feed_titles(nairobi), [])
+        self.assertEqual(self.feed_titles(mombasa), [])  # both segments now cached
+
+        self.task('Everywhere')
+        coastal = self.task('Coast only', target_cities=['Mombasa'])
+        self.assertEqual(self.feed_titles(nairobi), ['Everywhere'])
+        self.assertEqual(self.feed_titles(mombasa), ['Coast only', 'Everywhere'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            coastal.delete()
+        self.assertEqual(self.feed_titles(mombasa), ['Everywhere'])
+
+    def test_lost_version_key_does_not_serve_old_lists(self):
+        profile = self.worker('n', 'Nairobi')
+        self.assertEqual(self.feed_titles(profile), [])
+        cache.delete(feed.VERSION_KEY)
+        with mock.patch.object(transaction, 'on_commit', lambda callback: None):
+            Task.objects.create(
+                title='Missed bump', description='', reward_amount=10, posted_by='admin',
+                expires_at=timezone.now() + timedelta(days=1),
+            )
+        self.assertEqual(self.feed_titles(profile), ['Missed bump'])
+
+    def test_targeted_task_only_notifies_its_audience(self):
+        self.worker('n', 'Nairobi')
+        mombasa = self.worker('m', 'Mombasa')
+        self.worker('m2', 'Mombasa', device=False)
+        task = Task(
+            title='Coast only', description='', reward_amount=10, posted_by='admin',
+            expires_at=timezone.now() + timedelta(days=1), target_cities=['mombasa'],
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            TaskAdmin(Task, admin.site).save_model(None, task, form=None, change=False)
+        self.assertEqual(list(Notification.objects.values_list('profile_id', flat=True)), [mombasa.id])
+
+        untargeted = Task(
+            title='Everywhere', description='', reward_amount=10, posted_by='admin',
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+        TaskAdmin(Task, admin.site).save_model(None, untargeted, form=None, change=False)
+        self.assertTrue(Notification.objects.filter(profile__isnull=True, data__task_id=str(untargeted.id)).exists())
+
+
+# Profile with wallet, two dashboard aggregates, transactions with recipients, tasks
+BOOTSTRAP_QUERIES = 5
+
+
+class BootstrapTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.profile = self.make_user('worker', balance=40, first_name='Kamau', activated_at=timezone.now())
+        other = self.make_user('friend', first_name='Njeri')
+        for _ in range(3):
+            self.add_rows(other)
+
+    def add_rows(self, other):
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.create(wallet=self.profile.wallet, amount=5, type='transfer', recipient=other)
+            Task.objects.create(
+                title='Survey', description='', reward_amount=10, posted_by='admin',
+                expires_at=timezone.now() + timedelta(days=1),
+            )
+
+    def bootstrap(self, versions=None):
+        path = '/api/bootstrap/' + (f"?versions={','.join(f'{k}:{v}' for k, v in versions.items())}" if versions else '')
+        return self.client.get(path, HTTP_AUTHORIZATION='Bearer worker').json()
+
+    def test_unchanged_sections_are_left_out(self):
+        first = self.bootstrap()
+        self.assertEqual(set(first) - {'versions'}, {'profile', 'dashboard', 'wallet', 'tasks'})
+        self.assertEqual(len(first['tasks']), 3)
+
+        again = self.bootstrap(first['versions'])
+        self.assertEqual(again, {'versions': first['versions']})
+
+    def test_changed_sections_come_back_with_new_versions(self):
+        first = self.bootstrap()
+        Profile.objects.filter(pk=self.profile.pk).update(first_name='Kamau Jr')
+        Wallet.objects.filter(pk=self.profile.wallet.pk).update(balance=55)
+
+        changed = self.bootstrap(first['versions'])
+        self.assertEqual(set(changed) - {'versions'}, {'profile', 'dashboard', 'wallet'})
+        self.assertEqual(changed['profile']['first_name'], 'Kamau Jr')
+        self.assertEqual(changed['wallet']['balance'], 55.0)
+        for name in ('profile', 'dashboard', 'wallet'):
+            self.assertNotEqual(changed['versions'][name], first['versions'][name])
+        self.assertEqual(changed['versions']['tasks'], first['versions']['tasks'])
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.bootstrap()  # warm the feed cache
+        with self.assertNumQueries(BOOTSTRAP_QUERIES):
+            self.bootstrap()
+        other = Profile.objects.get(firebase_uid='friend')
+        for _ in range(10):
+            self.add_rows(other)
+        self.bootstrap()
+        with self.assertNumQueries(BOOTSTRAP_QUERIES):
+            self.bootstrap()
+
+
+class AuthPolicyTests(TestCase):
+    def webhook(self, event, **headers):
+        return self.client.post('/api/webhook/paystack/', data=json.dumps(event), content_type='application/json', **headers)
+
+    def sign(self, event):
+        return hmac.new(views.PAYSTACK_SECRET_KEY.encode(), json.dumps(event).encode(), hashlib.sha512).hexdigest()
+
+    def test_signed_webhook_needs_no_bearer_token(self):
+        event = {'event': 'transfer.success', 'data': {}}
+        response = self.webhook(event, HTTP_X_PAYSTACK_SIGNATURE=self.sign(event))
+        self.assertEqual(response.status_code, 200)
+
+    def test_unsigned_webhook_is_rejected(self):
+        event = {'event': 'charge.success', 'data': {}}
+        self.assertEqual(self.webhook(event).status_code, 401)
+        # Signature present but wrong: the view itself rejects it
+        self.assertEqual(self.webhook(event, HTTP_X_PAYSTACK_SIGNATURE='0' * 128).status_code, 400)
+
+    def test_undecorated_api_views_default_to_firebase(self):
+        self.assertEqual(self.client.get('/api/wallet/').status_code, 401)
+        self.assertEqual(self.client.get('/api/wallet/', HTTP_AUTHORIZATION='Token abc').status_code, 401)
+
+    def test_admin_and_unknown_paths_are_not_401d(self):
+        self.assertEqual(self.client.get('/admin/').status_code, 302)  # to the admin login
+        self.assertEqual(self.client.get('/admin/login/').status_code, 200)
+        self.assertEqual(self.client.get('/api/no-such-endpoint/').status_code, 404)
+        self.assertEqual(self.client.get('/nowhere').status_code, 404)
+        self.assertEqual(self.client.get('/healthz').status_code, 200)
+
+    def test_policy_table(self):
+        table = auth_policy.compile_policy_table()
+        self.assertEqual(table[views.paystack_webhook], auth_policy.Policy('signed-webhook', 'X-Paystack-Signature'))
+        self.assertEqual(table[views.wallet_data].kind, auth_policy.FIREBASE)
+        self.assertEqual(table[views.healthz].kind, auth_policy.PUBLIC)
+        self.assertEqual(table[resolve('/admin/login/').func].kind, auth_policy.PUBLIC)
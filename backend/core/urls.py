@@ -13,11 +13,15 @@ urlpatterns = [
     # path('mpesa/callback/', views.mpesa_callback, name='mpesa_callback'),
     
     path('dashboard/', views.dashboard_data, name='dashboard_data'),
+    path('bootstrap/', views.bootstrap, name='bootstrap'),
     path('tasks/', views.task_list, name='task_list'),
     path('tasks/<int:task_id>/submit/', views.submit_task, name='submit_task'),
     path('wallet/', views.wallet_data, name='wallet_data'),
     path('wallet/withdraw/', views.withdraw_funds, name='withdraw_funds'),
     path('wallet/transfer/', views.transfer_funds, name='transfer_funds'),
     path('settings/', views.update_settings, name='update_settings'),
+    path('devices/', views.device_token, name='device_token'),
     path('account/delete/', views.delete_account, name='delete_account'),
+
+    path('admin/analytics/daily/', views.analytics_daily, name='analytics_daily'),
 ]
\ No newline at end of file
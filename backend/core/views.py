@@ -5,25 +5,33 @@ import os
 import requests
 import hashlib
 import hmac
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
 from django.http import JsonResponse
+from django.core.serializers.json import DjangoJSONEncoder
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.views.decorators.csrf import csrf_exempt
 from django.db import transaction, models
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from decouple import config
+from kenya_earn.auth_policy import PUBLIC, SIGNED_WEBHOOK, auth_policy
 
-from .models import Profile, Wallet, Task, Payment, Transaction
+from .idempotency import idempotent
+from .models import Profile, Wallet, Task, Payment, Transaction, DailyRollup, DeviceToken
+from .services import accounts, feed, health, notifications, risk, wallets
+from .services.paystack import complete_activation
 from .serializers import (
     ProfileSerializer,
     ProfileCompletionSerializer,
     TaskSerializer,
     WalletSerializer,
     TransactionSerializer,
-    ActivateSerializer
+    ActivateSerializer,
+    DailyRollupSerializer
 )
 
 # Paystack config
@@ -51,7 +59,7 @@ def complete_profile(request):
     referred_by = None
     if data.get('referral_code'):
         try:
-            referred_by = Profile.objects.get(referral_code=data['referral_code'])
+            referred_by = Profile.objects.get(referral_code=data['referral_code'], deleted_at__isnull=True)
         except Profile.DoesNotExist:
             pass  # Should not happen due to validation
 
@@ -80,8 +88,8 @@ def complete_profile(request):
 
     # If referred by someone, create PENDING referral bonus
     if referred_by and created:
-        Transaction.objects.create(
-            wallet=referred_by.wallet,
+        wallets.record_transaction(
+            referred_by.wallet,
             amount=50.00,
             type='deposit',
             status='pending',
@@ -93,11 +101,13 @@ def complete_profile(request):
 
 @api_view(['GET', 'PUT'])
 def profile_detail(request):
-    profile = get_object_or_404(Profile, firebase_uid=request.firebase_uid)
     if request.method == 'GET':
-        serializer = ProfileSerializer(profile)
+        profiles = ProfileSerializer.sparse_queryset(Profile.objects.all(), request)
+        profile = get_object_or_404(profiles, firebase_uid=request.firebase_uid)
+        serializer = ProfileSerializer(profile, context={'request': request})
         return Response(serializer.data)
     elif request.method == 'PUT':
+        profile = get_object_or_404(Profile, firebase_uid=request.firebase_uid)
         serializer = ProfileSerializer(profile, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
@@ -109,6 +119,7 @@ def profile_detail(request):
 # -------------------------
 
 @api_view(['POST'])
+@idempotent
 def activate_account(request):
     profile = get_object_or_404(Profile, firebase_uid=request.firebase_uid)
     if profile.is_activated:
@@ -142,7 +153,7 @@ def activate_account(request):
     }
 
     try:
-        response = requests.post(url, json=payload, headers=headers)
+        response = requests.post(url, json=payload, headers=headers, timeout=15)
         response_data = response.json()
 
         if response_data.get('status'):
@@ -175,6 +186,7 @@ def verify_payment(request, reference):
         return Response({'activated': False}, status=404)
 
 
+@auth_policy(SIGNED_WEBHOOK, signature_header='X-Paystack-Signature')
 @csrf_exempt
 def paystack_webhook(request):
     """Secure Paystack webhook to confirm M-Pesa STK Push success"""
@@ -186,7 +198,7 @@ def paystack_webhook(request):
         PAYSTACK_SECRET_KEY.encode(), payload, hashlib.sha512
     ).hexdigest()
 
-    if signature != expected_sig:
+    if not signature or not hmac.compare_digest(signature, expected_sig):
         return JsonResponse({'status': 'invalid signature'}, status=400)
 
     try:
@@ -203,54 +215,9 @@ def paystack_webhook(request):
                     phone = field['value']
                     break
 
-            try:
-                payment = Payment.objects.get(mpesa_checkout_id=reference)
-                # Only activate if amount is at least Ksh 300
-                if payment.status != 'completed' and amount_paid >= 300:
-                    payment.status = 'completed'
-                    payment.save()
-
-                    profile = payment.profile
-                    profile.is_activated = True
-                    profile.save()
-
-                    # Handle referral bonus
-                    if profile.referred_by:
-                        try:
-                            referrer = profile.referred_by
-                            pending_bonus = Transaction.objects.filter(
-                                wallet=referrer.wallet,
-                                amount=50.00,
-                                type='deposit',
-                                status='pending',
-                                description__icontains=profile.first_name
-                            ).first()
-                            if pending_bonus:
-                                pending_bonus.status = 'completed'
-                                pending_bonus.save()
-                            else:
-                                Transaction.objects.create(
-                                    wallet=referrer.wallet,
-                                    amount=50.00,
-                                    type='deposit',
-                                    status='completed',
-                                    description=f"{profile.first_name} used your code"
-                                )
-                        except Exception as e:
-                            print(f"Referral bonus error: {e}")
-
-                    # Record activation transaction
-                    Transaction.objects.create(
-                        wallet=profile.wallet,
-                        amount=payment.amount,
-                        type='activation',
-                        status='completed'
-                    )
-
-            except Payment.DoesNotExist:
+            if not complete_activation(reference, amount_paid):
                 # Log for monitoring: unexpected payment
                 print(f"Webhook: Payment with reference {reference} not found")
-                pass
 
         return JsonResponse({'status': 'success'})
     except Exception as e:
@@ -261,36 +228,91 @@ def paystack_webhook(request):
 # DASHBOARD
 # -------------------------
 
-@api_view(['GET'])
-def dashboard_data(request):
-    profile = get_object_or_404(Profile, firebase_uid=request.firebase_uid)
-    
+def _greeting(profile):
     current_hour = timezone.now().hour
     if 5 <= current_hour < 12:
-        greeting = f"Good morning, {profile.first_name}"
+        return f"Good morning, {profile.first_name}"
     elif 12 <= current_hour < 17:
-        greeting = f"Good afternoon, {profile.first_name}"
-    else:
-        greeting = f"Good evening, {profile.first_name}"
+        return f"Good afternoon, {profile.first_name}"
+    return f"Good evening, {profile.first_name}"
 
-    completed_tasks = Task.objects.filter(assigned_to=profile, status='approved').count()
-    pending_tasks = Task.objects.filter(assigned_to=profile, status='pending').count()
+def _dashboard_stats(profile):
+    task_counts = Task.objects.filter(assigned_to=profile).aggregate(
+        completed_tasks=models.Count('id', filter=models.Q(status='approved')),
+        pending_tasks=models.Count('id', filter=models.Q(status='pending')),
+    )
     total_earnings = Transaction.objects.filter(
-        wallet=profile.wallet,
+        wallet__profile=profile,
         type__in=['deposit', 'activation'],
         status='completed'
     ).aggregate(total=models.Sum('amount'))['total'] or 0
 
+    return {
+        'completed_tasks': task_counts['completed_tasks'],
+        'pending_tasks': task_counts['pending_tasks'],
+        'total_earnings': float(total_earnings),
+    }
+
+@api_view(['GET'])
+def dashboard_data(request):
+    profile = get_object_or_404(Profile, firebase_uid=request.firebase_uid)
     return Response({
-        'greeting': greeting,
+        'greeting': _greeting(profile),
         'is_activated': profile.is_activated,
-        'stats': {
-            'completed_tasks': completed_tasks,
-            'pending_tasks': pending_tasks,
-            'total_earnings': float(total_earnings),
-        }
+        'stats': _dashboard_stats(profile),
     })
 
+# -------------------------
+# BOOTSTRAP
+# -------------------------
+
+BOOTSTRAP_PAGE_SIZE = 20
+
+def _section_version(data):
+    encoded = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder).encode()
+    return hashlib.sha1(encoded).hexdigest()[:12]
+
+@api_view(['GET'])
+def bootstrap(request):
+    """
+    Everything the app needs on load in one round trip. Clients send back
+    the versions they hold (?versions=profile:abc,wallet:def) and sections
+    that haven't changed are left out of the response.
+    """
+    profile = get_object_or_404(
+        Profile.objects.select_related('wallet'), firebase_uid=request.firebase_uid
+    )
+    wallet = getattr(profile, 'wallet', None)
+
+    sections = {
+        'profile': ProfileSerializer(profile).data,
+        'dashboard': {
+            'greeting': _greeting(profile),
+            'is_activated': profile.is_activated,
+            'stats': _dashboard_stats(profile),
+        },
+    }
+    if wallet is not None:
+        transactions = wallet.transactions.select_related('recipient').order_by('-timestamp')
+        sections['wallet'] = {
+            'balance': float(wallets.get_balance(wallet)),
+            'transactions': TransactionSerializer(transactions[:BOOTSTRAP_PAGE_SIZE], many=True).data,
+        }
+    if profile.is_activated:
+        tasks = feed.tasks_for(profile, limit=BOOTSTRAP_PAGE_SIZE)
+        sections['tasks'] = TaskSerializer(tasks, many=True).data
+
+    client_versions = dict(
+        item.split(':', 1) for item in request.GET.get('versions', '').split(',') if ':' in item
+    )
+    response = {'versions': {}}
+    for name, data in sections.items():
+        version = _section_version(data)
+        response['versions'][name] = version
+        if client_versions.get(name) != version:
+            response[name] = data
+    return Response(response)
+
 # -------------------------
 # TASKS
 # -------------------------
@@ -303,11 +325,12 @@ def task_list(request):
 
     status_filter = request.GET.get('status', 'available')
     if status_filter == 'available':
-        tasks = Task.objects.filter(status='available', expires_at__gt=timezone.now())
+        # Cached candidate list for the user's city and cohort
+        tasks = feed.tasks_for(profile, TaskSerializer.sparse_queryset(Task.objects.all(), request))
     else:
         tasks = Task.objects.filter(assigned_to=profile, status=status_filter)
-
-    serializer = TaskSerializer(tasks, many=True)
+        tasks = TaskSerializer.sparse_queryset(tasks, request)
+    serializer = TaskSerializer(tasks, many=True, context={'request': request})
     return Response(serializer.data)
 
 @api_view(['POST'])
@@ -330,14 +353,24 @@ def submit_task(request, task_id):
 def wallet_data(request):
     profile = get_object_or_404(Profile, firebase_uid=request.firebase_uid)
     wallet = get_object_or_404(Wallet, profile=profile)
-    transactions = wallet.transactions.all().order_by('-timestamp')
+    transactions = TransactionSerializer.sparse_queryset(wallet.transactions.all(), request)
+    transactions = transactions.order_by('-timestamp')
 
-    return Response({
-        'balance': float(wallet.balance),
-        'transactions': TransactionSerializer(transactions, many=True).data
-    })
+    data = {
+        'balance': float(wallets.get_balance(wallet)),
+        'transactions': TransactionSerializer(transactions, many=True, context={'request': request}).data
+    }
+    if request.GET.get('as_of'):
+        as_of = parse_datetime(request.GET['as_of'])
+        if as_of is None:
+            return Response({'error': 'as_of must be an ISO 8601 datetime'}, status=400)
+        if timezone.is_naive(as_of):
+            as_of = timezone.make_aware(as_of)
+        data['balance_as_of'] = float(wallets.ledger_balance(wallet, as_of=as_of))
+    return Response(data)
 
 @api_view(['POST'])
+@idempotent
 def withdraw_funds(request):
     profile = get_object_or_404(Profile, firebase_uid=request.firebase_uid)
     if not profile.is_activated:
@@ -345,26 +378,35 @@ def withdraw_funds(request):
 
     amount = request.data.get('amount')
     try:
-        amount = float(amount)
-    except (TypeError, ValueError):
+        amount = Decimal(str(amount))
+    except (TypeError, ValueError, InvalidOperation):
         return Response({'error': 'Invalid amount'}, status=400)
 
-    if amount <= 0:
+    if not amount.is_finite() or amount <= 0:
         return Response({'error': 'Amount must be positive'}, status=400)
 
-    if profile.wallet.balance < amount:
-        return Response({'error': 'Insufficient balance'}, status=400)
+    try:
+        risk.check('withdraw', request, profile, amount)
+    except risk.VelocityExceeded:
+        return Response({'error': 'Too many withdrawals, try again later'}, status=429)
 
-    Transaction.objects.create(
-        wallet=profile.wallet,
-        amount=amount,
-        type='withdrawal',
-        status='pending'
-    )
+    with transaction.atomic():
+        # Reserve the funds now so the same money can't be withdrawn twice
+        if not wallets.debit(profile.wallet, amount):
+            return Response({'error': 'Insufficient balance'}, status=400)
+
+        wallets.record_transaction(
+            profile.wallet,
+            amount=amount,
+            type='withdrawal',
+            status='pending',
+            direction='debit'
+        )
 
     return Response({'status': 'Withdrawal request submitted'})
 
 @api_view(['POST'])
+@idempotent
 def transfer_funds(request):
     sender = get_object_or_404(Profile, firebase_uid=request.firebase_uid)
     if not sender.is_activated:
@@ -377,41 +419,46 @@ def transfer_funds(request):
         return Response({'error': 'Recipient and amount required'}, status=400)
 
     try:
-        amount = float(amount)
-    except (TypeError, ValueError):
+        amount = Decimal(str(amount))
+    except (TypeError, ValueError, InvalidOperation):
         return Response({'error': 'Invalid amount'}, status=400)
 
-    if amount <= 0:
+    if not amount.is_finite() or amount <= 0:
         return Response({'error': 'Amount must be positive'}, status=400)
 
     try:
-        recipient = Profile.objects.get(referral_code=recipient_code)
+        recipient = Profile.objects.get(referral_code=recipient_code, deleted_at__isnull=True)
     except Profile.DoesNotExist:
         return Response({'error': 'Recipient not found'}, status=404)
 
-    if sender.wallet.balance < amount:
-        return Response({'error': 'Insufficient balance'}, status=400)
+    try:
+        risk.check('transfer', request, sender, amount, recipient)
+    except risk.VelocityExceeded:
+        return Response({'error': 'Too many transfers, try again later'}, status=429)
 
     with transaction.atomic():
-        sender.wallet.balance -= amount
-        recipient.wallet.balance += amount
-        sender.wallet.save()
-        recipient.wallet.save()
+        if not wallets.transfer(sender.wallet, recipient.wallet, amount):
+            return Response({'error': 'Insufficient balance'}, status=400)
 
-        Transaction.objects.create(
-            wallet=sender.wallet,
+        wallets.record_transaction(
+            sender.wallet,
             amount=amount,
             type='transfer',
             status='completed',
+            direction='debit',
             recipient=recipient
         )
-        Transaction.objects.create(
-            wallet=recipient.wallet,
+        wallets.record_transaction(
+            recipient.wallet,
             amount=amount,
             type='transfer',
             status='completed',
             recipient=sender
         )
+        notifications.notify(
+            recipient, 'transfer.received', "Money received",
+            f"{sender.first_name} sent you KES {amount}", {'amount': amount},
+        )
 
     return Response({'status': 'Transfer completed'})
 
@@ -429,8 +476,88 @@ def update_settings(request):
         return Response({'theme_preference': profile.theme_preference})
     return Response({'error': 'Invalid theme'}, status=400)
 
+@api_view(['POST', 'DELETE'])
+def device_token(request):
+    profile = get_object_or_404(Profile, firebase_uid=request.firebase_uid)
+    token = request.data.get('token')
+    if not token:
+        return Response({'error': 'Token required'}, status=400)
+
+    if request.method == 'DELETE':
+        DeviceToken.objects.filter(profile=profile, token=token).delete()
+        return Response({'status': 'Device removed'})
+
+    # A token moves with the device, so re-registering hands it to the new user
+    DeviceToken.objects.update_or_create(token=token, defaults={'profile': profile})
+    return Response({'status': 'Device registered'})
+
 @api_view(['DELETE'])
 def delete_account(request):
     profile = get_object_or_404(Profile, firebase_uid=request.firebase_uid)
-    profile.delete()
-    return Response({'status': 'Account deleted'})
\ No newline at end of file
+    # Related rows are purged in the background by purge_deleted_accounts
+    accounts.tombstone(profile)
+    return Response({'status': 'Account deleted'})
+
+# -------------------------
+# ADMIN ANALYTICS
+# -------------------------
+
+def _is_admin(request):
+    # Set with firebase_admin.auth.set_custom_user_claims(uid, {'admin': True})
+    return bool(getattr(request, 'firebase_user', {}).get('admin'))
+
+@api_view(['GET'])
+def analytics_daily(request):
+    """Daily rollups for the admin dashboard. Filters: start, end (YYYY-MM-DD), city."""
+    if not _is_admin(request):
+        return Response({'error': 'Admin access required'}, status=403)
+
+    try:
+        end = date.fromisoformat(request.GET['end']) if request.GET.get('end') else timezone.localdate()
+        start = date.fromisoformat(request.GET['start']) if request.GET.get('start') else end - timedelta(days=29)
+    except ValueError:
+        return Response({'error': 'start and end must be YYYY-MM-DD'}, status=400)
+
+    rollups = DailyRollup.objects.filter(day__gte=start, day__lte=end).order_by('day', 'city')
+    if request.GET.get('city'):
+        rollups = rollups.filter(city__iexact=request.GET['city'])
+
+    totals = rollups.aggregate(
+        signups=models.Sum('signups'),
+        referred_signups=models.Sum('referred_signups'),
+        referred_activations=models.Sum('referred_activations'),
+        activations=models.Sum('activations'),
+        revenue=models.Sum('revenue'),
+        payouts=models.Sum('payouts'),
+        transfer_volume=models.Sum('transfer_volume'),
+    )
+    totals = {key: value or 0 for key, value in totals.items()}
+    totals['referral_conversion'] = (
+        totals['referred_activations'] / totals['referred_signups'] if totals['referred_signups'] else 0
+    )
+
+    return Response({
+        'start': start,
+        'end': end,
+        'totals': totals,
+        'rows': DailyRollupSerializer(rollups, many=True).data,
+    })
+
+# -------------------------
+# HEALTH
+# -------------------------
+# Plain Django views, public, so load balancer probes skip DRF and Firebase
+
+@auth_policy(PUBLIC)
+def healthz(request):
+    return JsonResponse({'status': 'ok'})
+
+@auth_policy(PUBLIC)
+def readyz(request):
+    checks = {'database': health.check_database(), 'firebase': health.check_firebase()}
+    ready = all(error is None for error in checks.values())
+    return JsonResponse(
+        {'status': 'ok' if ready else 'unavailable',
+         'checks': {name: error or 'ok' for name, error in checks.items()}},
+        status=200 if ready else 503,
+    )
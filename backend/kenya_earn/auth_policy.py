@@ -0,0 +1,60 @@
+# kenya-earn/backend/kenya_earn/auth_policy.py
+"""
+Per-view authentication policies for FirebaseAuthenticationMiddleware.
+
+A view declares its policy with @auth_policy(...), placed above @api_view
+so it lands on the final view function, or gets one by URL name (or
+'namespace:' prefix) from AUTH_POLICY_BY_URL_NAME. Anything else falls
+back to AUTH_POLICY_DEFAULT. compile_policy_table() walks the URLconf
+once so the middleware only does a dict lookup per request.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.urls import URLResolver, get_resolver
+
+PUBLIC = 'public'
+SIGNED_WEBHOOK = 'signed-webhook'
+FIREBASE = 'firebase'
+
+# signature_header: for signed webhooks, the header that must be present;
+# the view itself verifies the signature against the raw body
+Policy = namedtuple('Policy', ['kind', 'signature_header'], defaults=[None])
+
+
+def auth_policy(kind, signature_header=None):
+    if kind not in (PUBLIC, SIGNED_WEBHOOK, FIREBASE):
+        raise ValueError(f"Unknown auth policy {kind!r}")
+    if kind == SIGNED_WEBHOOK and not signature_header:
+        raise ValueError("Signed webhooks need a signature_header")
+
+    def decorator(view):
+        view.auth_policy = Policy(kind, signature_header)
+        return view
+    return decorator
+
+
+def _from_settings(name, namespace):
+    by_name = settings.AUTH_POLICY_BY_URL_NAME
+    kind = (name and by_name.get(name)) or by_name.get(namespace) or settings.AUTH_POLICY_DEFAULT
+    return Policy(kind)
+
+
+def policy_for(view, name=None, namespace=''):
+    return getattr(view, 'auth_policy', None) or _from_settings(name, namespace)
+
+
+def compile_policy_table(urlconf=None):
+    """Map every routed view function to its Policy."""
+    table = {}
+
+    def walk(patterns, namespace):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                walk(pattern.url_patterns, f"{namespace}{pattern.namespace}:" if pattern.namespace else namespace)
+            else:
+                name = f"{namespace}{pattern.name}" if pattern.name else None
+                table[pattern.callback] = policy_for(pattern.callback, name, namespace)
+
+    walk(get_resolver(urlconf).url_patterns, '')
+    return table
@@ -1,9 +1,20 @@
 # kenya-earn/backend/kenya_earn/middleware.py
+import random
 import firebase_admin
 from firebase_admin import credentials, auth
 from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
 from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
 from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+
+from kenya_earn import auth_policy
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; fall back to gzip only
+    brotli = None
 
 
 # Initialize Firebase only once
@@ -18,10 +29,23 @@ if not firebase_admin._apps:
 
 
 class FirebaseAuthenticationMiddleware(MiddlewareMixin):
-    def process_request(self, request):
-        # Skip auth for admin, static, media, and public paths
-        exempt_urls = ['/admin/', '/static/', '/media/', '/api/schema/', '/api/docs/']
-        if any(request.path.startswith(url) for url in exempt_urls):
+    """
+    Enforce each view's auth policy (see kenya_earn.auth_policy). Runs in
+    process_view, after URL resolution, so unknown paths get a plain 404.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.policies = auth_policy.compile_policy_table()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        policy = self.policies.get(view_func) or auth_policy.policy_for(view_func)
+        if policy.kind == auth_policy.PUBLIC:
+            return None
+        if policy.kind == auth_policy.SIGNED_WEBHOOK:
+            # Cheap reject; the view checks the signature against the body
+            if not request.headers.get(policy.signature_header):
+                return JsonResponse({'error': 'Signature missing'}, status=401)
             return None
 
         auth_header = request.META.get('HTTP_AUTHORIZATION')
@@ -36,4 +60,97 @@ class FirebaseAuthenticationMiddleware(MiddlewareMixin):
         except Exception as e:
             return JsonResponse({'error': 'Invalid Firebase token', 'details': str(e)}, status=401)
 
-        return None
\ No newline at end of file
+        return None
+
+
+def accepted_encodings(header):
+    """Parse Accept-Encoding into {coding: q}, e.g. 'gzip, br;q=0' -> {'gzip': 1.0, 'br': 0.0}."""
+    codings = {}
+    for item in header.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding.lower()] = q
+    return codings
+
+
+class ResponseCompressionMiddleware(MiddlewareMixin):
+    """
+    Compress API (JSON) responses with brotli or gzip, whichever the client
+    accepts. HTML, such as the admin's pages with their CSRF tokens, is
+    left alone, and gzip output gets GZipMiddleware's random-length padding
+    against BREACH. Static files are left to WhiteNoise, which serves them
+    precompressed.
+    """
+    max_random_bytes = 100
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        if response.get('Content-Type', '').split(';')[0].strip() != 'application/json':
+            return response
+
+        min_size = getattr(settings, 'RESPONSE_COMPRESSION_MIN_SIZE', 1024)
+        if len(response.content) < min_size:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        # Highest q wins, brotli on a tie; q=0 means "not acceptable"
+        offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+        encoding = max(offered, key=lambda c: accepted.get(c, accepted.get('*', 0)))
+        if accepted.get(encoding, accepted.get('*', 0)) <= 0:
+            return response
+        if encoding == 'br':
+            compressed = brotli.compress(response.content, quality=5)
+        else:
+            compressed = compress_string(response.content, max_random_bytes=self.max_random_bytes)
+
+        # Skip when compression doesn't pay for itself
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profile a request when it carries a valid X-Profile-Token (see the
+    profiling_token command) or is picked by PROFILING_SAMPLE_RATE. The
+    report id is returned in X-Profile-Id and browsable at /admin/profiling/.
+    Removed from the stack entirely unless PROFILING_ENABLED is set.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        from core.services import profiling
+        self.profiling = profiling
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+
+    def __call__(self, request):
+        token = request.headers.get('X-Profile-Token')
+        trigger = self.profiling.check_token(token) if token else None
+        if trigger is None and self.sample_rate and random.random() < self.sample_rate:
+            trigger = 'sampled'
+        if trigger is None:
+            return self.get_response(request)
+
+        response, report_id = self.profiling.profile_request(self.get_response, request, trigger)
+        response['X-Profile-Id'] = report_id
+        return response
@@ -1,7 +1,9 @@
 import os
 import json
+import sys
 from pathlib import Path
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -32,6 +34,8 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'kenya_earn.middleware.ProfilingMiddleware',
+    'kenya_earn.middleware.ResponseCompressionMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -97,6 +101,72 @@ STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
+# API response compression (bytes below which responses are sent as-is)
+RESPONSE_COMPRESSION_MIN_SIZE = config('RESPONSE_COMPRESSION_MIN_SIZE', default=1024, cast=int)
+
+# Idempotency-Key replay window (seconds)
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', default=24 * 60 * 60, cast=int)
+
+# Sub-balance rows per hot (sharded) wallet
+WALLET_SHARD_COUNT = config('WALLET_SHARD_COUNT', default=8, cast=int)
+
+# Change stream: where the outbox relay publishes events
+OUTBOX_SINK = config('OUTBOX_SINK', default='core.services.outbox.SegmentedFileSink')
+# Keyword arguments for the sink, as a JSON object; the file sink defaults to OUTBOX_STREAM_DIR
+OUTBOX_SINK_OPTIONS = config('OUTBOX_SINK_OPTIONS', default='', cast=lambda value: json.loads(value) if value else None)
+if OUTBOX_SINK_OPTIONS is None:
+    if OUTBOX_SINK == 'core.services.outbox.SegmentedFileSink':
+        OUTBOX_SINK_OPTIONS = {'directory': config('OUTBOX_STREAM_DIR', default=str(BASE_DIR / 'outbox_stream'))}
+    else:
+        OUTBOX_SINK_OPTIONS = {}
+
+# Push notifications: FirebaseSender in production, FakeSender for local runs
+NOTIFICATION_SENDER = config('NOTIFICATION_SENDER', default='core.services.notifications.FirebaseSender')
+NOTIFICATION_SENDER_OPTIONS = {}
+
+# Shared cache (velocity counters, feeds). Local memory is per process, so
+# under multi-worker gunicorn every limit would be multiplied by the worker
+# count: only allowed for local development and tests.
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL}}
+elif DEBUG or 'test' in sys.argv:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+else:
+    raise ImproperlyConfigured("REDIS_URL must be set when DEBUG is off")
+
+# Velocity limits per action and dimension: max requests and/or KES within window seconds
+RISK_LIMITS = {
+    'transfer': {
+        'sender': {'count': 10, 'amount': 20000, 'window': 60 * 60},
+        'recipient': {'count': 20, 'amount': 50000, 'window': 60 * 60},
+        'device': {'count': 20, 'window': 60 * 60},
+        'ip': {'count': 60, 'window': 60 * 60},
+    },
+    'withdraw': {
+        'sender': {'count': 3, 'amount': 50000, 'window': 24 * 60 * 60},
+        'device': {'count': 5, 'window': 24 * 60 * 60},
+    },
+}
+# Users activated within this many days see tasks targeted at the 'new' cohort
+TASK_NEW_USER_DAYS = config('TASK_NEW_USER_DAYS', default=30, cast=int)
+
+# Proxies in front of the app that append to X-Forwarded-For (1 on Render).
+# 0 disables the per-IP limit, since REMOTE_ADDR is then the proxy's address.
+RISK_TRUSTED_PROXY_HOPS = config('RISK_TRUSTED_PROXY_HOPS', default=0, cast=int)
+
+# On-demand request profiling (ProfilingMiddleware); off means no per-request cost at all
+PROFILING_ENABLED = config('PROFILING_ENABLED', default=False, cast=bool)
+PROFILING_SAMPLE_RATE = config('PROFILING_SAMPLE_RATE', default=0.0, cast=float)
+PROFILING_DIR = config('PROFILING_DIR', default=str(BASE_DIR / 'profiles'))
+PROFILING_MAX_REPORTS = config('PROFILING_MAX_REPORTS', default=50, cast=int)
+
+# Auth policy for views without an @auth_policy decorator, by URL name or 'namespace:'
+AUTH_POLICY_DEFAULT = 'firebase'
+AUTH_POLICY_BY_URL_NAME = {
+    'admin:': 'public',  # Django admin uses its own session login
+}
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -133,4 +203,5 @@ else:
 
 # Paystack
 PAYSTACK_PUBLIC_KEY = config('PAYSTACK_PUBLIC_KEY', default='pk_test_xxx')
-PAYSTACK_SECRET_KEY = config('PAYSTACK_SECRET_KEY', default='sk_test_xxx')
\ No newline at end of file
+PAYSTACK_SECRET_KEY = config('PAYSTACK_SECRET_KEY', default='sk_test_xxx')
+PAYSTACK_API_BASE = config('PAYSTACK_API_BASE', default='https://api.paystack.co')
\ No newline at end of file
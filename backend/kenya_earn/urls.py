@@ -1,8 +1,13 @@
 # kenya-earn/backend/kenya_earn/urls.py
 from django.contrib import admin
 from django.urls import path, include
+from core import views
+from core.admin import profiling_urls
 
 urlpatterns = [
+    path('healthz', views.healthz, name='healthz'),
+    path('readyz', views.readyz, name='readyz'),
+    path('admin/profiling/', include(profiling_urls)),
     path('admin/', admin.site.urls),
     path('api/', include('core.urls')),
 ]
\ No newline at end of file